@@ -0,0 +1,126 @@
+"""
+Throughput benchmark of the CMake lexer against the line-based heuristics it replaced
+(str.count of parentheses, split("(", 1) and shlex.split of the set() arguments).
+
+Generates a large CMakeLists.txt in memory, parses it with both approaches and reports
+lines/sec, MB/sec and whether both found the same blocks, as JSON.
+
+Run from the repository root:
+    python -m benchmarks.bench_lexer --blocks 2000 --sources 50
+"""
+import argparse
+import json
+import os
+import re
+import shlex
+import time
+from src.cmake_watcher import CMakeWatcher
+
+_SET_RE = re.compile(r'^(\s*)set\s*\(', re.IGNORECASE)
+_ADD_SUBDIRECTORY_RE = re.compile(r'\badd_subdirectory\s*\(', re.IGNORECASE)
+
+
+def legacy_parse_lines(lines, marker=CMakeWatcher.SPECIAL_MARKER):
+    """The previous parser: returns ([(var_name, files)], subdirs)."""
+    observed_vars = []
+    subdirs = []
+    i = 0
+    marker_found = False
+    total_lines = len(lines)
+    while i < total_lines:
+        line = lines[i]
+        if marker in line:
+            marker_found = True
+            i += 1
+            continue
+        m = _SET_RE.match(line)
+        sub = None if m else _ADD_SUBDIRECTORY_RE.search(line)
+        if not m and not sub:
+            i += 1
+            continue
+        start = i
+        paren_count = line.count('(') - line.count(')')
+        i += 1
+        while paren_count > 0 and i < total_lines:
+            paren_count += lines[i].count('(') - lines[i].count(')')
+            i += 1
+        command_block = "".join(lines[start:i])
+        if sub:
+            parts = command_block[sub.end():].rsplit(")", 1)[0].split()
+            if parts:
+                subdirs.append(parts[0].strip('"'))
+        elif marker_found:
+            inner = command_block.split("(", 1)[1].rsplit(")", 1)[0].strip()
+            try:
+                tokens = shlex.split(inner)
+            except ValueError:
+                tokens = inner.split()
+            if tokens:
+                observed_vars.append((tokens[0], [os.path.normpath(token) for token in tokens[1:]]))
+            marker_found = False
+    return observed_vars, subdirs
+
+
+def generate_lines(blocks, sources):
+    """A CMakeLists.txt with `blocks` observed set() commands of `sources` files each, plus unrelated commands."""
+    lines = ["cmake_minimum_required(VERSION 3.16)\n", "project(Bench LANGUAGES CXX)\n"]
+    for b in range(blocks):
+        lines.append(f"# Group {b}: generated sources\n")
+        lines.append(f"add_subdirectory(lib{b})\n")
+        lines.append(f"{CMakeWatcher.SPECIAL_MARKER}\n")
+        lines.append(f"set(Group{b}_Sources\n")
+        lines += [f'    "group{b}/src/file_{s}.cpp"\n' for s in range(sources)]
+        lines.append(")\n")
+        lines.append(f"target_sources(bench PRIVATE ${{Group{b}_Sources}})\n")
+    return lines
+
+
+def measure(parse, lines, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = parse(lines)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CMake lexer against the legacy line heuristics.")
+    parser.add_argument("--blocks", type=int, default=2000, help="Observed set() commands in the generated file")
+    parser.add_argument("--sources", type=int, default=50, help="Files listed per set() command")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parser; the fastest one is reported")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    lines = generate_lines(args.blocks, args.sources)
+    size = sum(len(line.encode()) for line in lines)
+    watcher = CMakeWatcher(os.path.join(os.getcwd(), "CMakeLists.txt"))
+    legacy_seconds, legacy = measure(legacy_parse_lines, lines, args.repeat)
+    lexer_seconds, (blocks, subdirs) = measure(watcher._parse_lines, lines, args.repeat)
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "lines": len(lines),
+        "bytes": size,
+        "results": [],
+        "same_blocks": legacy == ([(b.var_name, b.tokens) for b in blocks], subdirs),
+    }
+    for name, seconds in (("legacy", legacy_seconds), ("lexer", lexer_seconds)):
+        report["results"].append({
+            "parser": name,
+            "seconds": round(seconds, 6),
+            "lines_per_second": round(len(lines) / seconds) if seconds else None,
+            "mb_per_second": round(size / seconds / 1e6, 2) if seconds else None,
+        })
+    report["speedup"] = round(legacy_seconds / lexer_seconds, 2) if lexer_seconds else None
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
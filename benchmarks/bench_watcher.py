@@ -0,0 +1,193 @@
+"""
+Benchmark harness for the CMake watcher.
+
+Generates a synthetic add_subdirectory() tree, parses it and replays scripted event storms
+directly into FileEventHandler, then reports startup time, per-event latency percentiles,
+events/sec, peak RSS and bytes written as JSON. With --backups the backup store is enabled,
+as in normal operation.
+
+Run from the repository root:
+    python -m benchmarks.bench_watcher --depth 3 --fanout 4 --variables 4 --sources 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+from src.cmake_watcher import CMakeWatcher
+from src.file_event_handler import FileEventHandler
+
+STORMS = ("mass-create", "rename-dir", "branch-switch")
+
+
+def generate_project(root, depth, fanout, variables, sources):
+    """
+    Write a tree of CMakeLists.txt files `depth` levels deep with `fanout` subdirectories each.
+    Every CMake file observes `variables` variables listing `sources` files in var<N>/.
+    Returns the path of the main CMake file and the list of source directories.
+    """
+    source_dirs = []
+
+    def write_level(directory, level):
+        children = [f"sub{i}" for i in range(fanout)] if level < depth else []
+        lines = ["cmake_minimum_required(VERSION 3.16)\n"]
+        lines += [f"add_subdirectory({child})\n" for child in children]
+        for v in range(variables):
+            var_dir = os.path.join(directory, f"var{v}")
+            os.makedirs(var_dir, exist_ok=True)
+            source_dirs.append(var_dir)
+            lines.append("#!CMAKE_WATCHER_OBSERVE\n")
+            lines.append(f"set(Var{v}_Sources\n")
+            lines += [f'"var{v}/file{s}.cpp"\n' for s in range(sources)]
+            lines.append(")\n")
+        with open(os.path.join(directory, "CMakeLists.txt"), "w") as f:
+            f.writelines(lines)
+        for child in children:
+            child_dir = os.path.join(directory, child)
+            os.makedirs(child_dir, exist_ok=True)
+            write_level(child_dir, level + 1)
+
+    write_level(root, 0)
+    return os.path.join(root, "CMakeLists.txt"), source_dirs
+
+
+def storm_events(storm, source_dirs, sources, count, rng):
+    """Return the scripted watchdog events of a storm."""
+    events = []
+    if storm == "mass-create":
+        for i in range(count):
+            directory = rng.choice(source_dirs)
+            events.append(FileCreatedEvent(os.path.join(directory, f"new{i}.cpp")))
+    elif storm == "rename-dir":
+        # A directory rename reaches the handler as one move per file.
+        directory = rng.choice(source_dirs)
+        for s in range(min(count, sources)):
+            name = f"file{s}.cpp"
+            events.append(FileMovedEvent(os.path.join(directory, name), os.path.join(directory + "_renamed", name)))
+    elif storm == "branch-switch":
+        # Checkout churn: files vanish, come back through temp-file swaps and get rewritten.
+        for i in range(count):
+            directory = rng.choice(source_dirs)
+            path = os.path.join(directory, f"file{rng.randrange(sources)}.cpp")
+            kind = rng.randrange(4)
+            if kind == 0:
+                events.append(FileDeletedEvent(path))
+            elif kind == 1:
+                events.append(FileCreatedEvent(path))
+            elif kind == 2:
+                events.append(FileModifiedEvent(path))
+            else:
+                tmp = path + f".tmp{i}"
+                events.append(FileCreatedEvent(tmp))
+                events.append(FileMovedEvent(tmp, path))
+    else:
+        raise ValueError(f"Unknown storm: {storm}")
+    return events
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_storm(main_cmake, storm, source_dirs, args, rng):
+    watcher = CMakeWatcher(main_cmake)
+    started = time.perf_counter()
+    watcher.parse(workers=args.parse_workers)
+    startup = time.perf_counter() - started
+    if args.backups:
+        # Every flushed batch then snapshots the files it rewrites, as the watcher does by default.
+        watcher.backup_files(keep=args.backup_keep)
+    handler = FileEventHandler(watcher, debounce=args.debounce)
+    events = storm_events(storm, source_dirs, args.sources, args.events, rng)
+    latencies = []
+    started = time.perf_counter()
+    for event in events:
+        t0 = time.perf_counter()
+        handler.dispatch(event)
+        latencies.append(time.perf_counter() - t0)
+    flush_started = time.perf_counter()
+    handler.flush()
+    flush_time = time.perf_counter() - flush_started
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "storm": storm,
+        "cmake_files": len(watcher.results),
+        "startup_seconds": startup,
+        "events": len(events),
+        "elapsed_seconds": elapsed,
+        "flush_seconds": flush_time,
+        "events_per_second": len(events) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        "files_written": watcher.writer.files_written,
+        "bytes_written": watcher.writer.bytes_written,
+        "handler": handler.stats(),
+        "backup_snapshots": len(watcher.backup_store.list_ids()) if watcher.backup_store else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CMake watcher on synthetic projects and event storms.")
+    parser.add_argument("--depth", type=int, default=2, help="Levels of add_subdirectory() below the main CMake file")
+    parser.add_argument("--fanout", type=int, default=4, help="Subdirectories per CMake file")
+    parser.add_argument("--variables", type=int, default=4, help="Observed variables per CMake file")
+    parser.add_argument("--sources", type=int, default=50, help="Sources listed per variable")
+    parser.add_argument("--events", type=int, default=2000, help="Events per storm")
+    parser.add_argument("--storm", action="append", choices=STORMS,
+                        help="Storm(s) to run (repeatable, default: all)")
+    parser.add_argument("--debounce", type=float, default=0.0,
+                        help="Quiet window of the handler; > 0 measures coalesced batches flushed at the end")
+    parser.add_argument("--backups", action="store_true",
+                        help="Snapshot the CMake files into the backup store at startup and before every write")
+    parser.add_argument("--backup-keep", type=int, default=50, help="Snapshots kept by the backup store with --backups")
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Directory in which the synthetic projects are generated (default: system temp)")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")}, "results": []}
+    for storm in args.storm or STORMS:
+        # Every storm starts from a freshly generated tree so results are independent.
+        root = tempfile.mkdtemp(prefix="cmake_watcher_bench_", dir=args.workdir)
+        try:
+            main_cmake, source_dirs = generate_project(root, args.depth, args.fanout, args.variables, args.sources)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_storm(main_cmake, storm, source_dirs, args, rng)
+            report["results"].append(result)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    report["peak_rss_bytes"] = peak_rss_bytes()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
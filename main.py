@@ -1,49 +1,320 @@
 import os
+import json
 import time
+import signal
+import asyncio
+import logging
 import argparse
 from watchdog.observers import Observer
+from src.async_pipeline import AsyncPipeline
+from src.backup_store import BackupStore
 from src.cmake_watcher import CMakeWatcher
+from src.cmake_writer import CMakeWriter
+from src.daemon import WatcherDaemon, send_command
+from src.event_log import EventRecorder, replay, unified_diffs
 from src.file_event_handler import FileEventHandler
+from src.metrics import METRICS, PROFILER, MetricsReporter, RateLimitFilter
+from src.polling_observer import PollingObserver
+from src.watch_filter import WatchFilter
+from src.watch_scheduler import WatchScheduler
+
+logger = logging.getLogger("cmake_watcher")
 
 def main():
     parser = argparse.ArgumentParser(
         description="File watcher and CMake updater. Parses CMake files for variables preceded by '#!CMAKE_WATCHER_OBSERVE' and updates them when watched files change."
     )
-    parser.add_argument("cmake_file", help="Path to the main CMake file (usually CMakeLists.txt)")
+    parser.add_argument("cmake_files", nargs="*", metavar="cmake_file",
+                        help="Path to the main CMake file (usually CMakeLists.txt); with --daemon, any number of "
+                             "projects to start with; with --control, the command and its arguments")
+    parser.add_argument("--debounce", type=float, default=0.25, metavar="SECONDS",
+                        help="Quiet window used to coalesce bursts of file events (0 applies every event immediately)")
+    parser.add_argument("--parse-workers", type=int, default=None, metavar="N",
+                        help="Number of threads used to parse add_subdirectory() trees (default: chosen by Python)")
+    parser.add_argument("--parse-timing", action="store_true",
+                        help="Print the parse time of every CMake file")
+    parser.add_argument("--cache", nargs="?", const="", default=None, metavar="PATH",
+                        help="Keep parse results in a cache file so restarts only re-parse changed CMake files "
+                             "(default location: .cmake_watcher_cache next to the main CMake file)")
+    parser.add_argument("--watch-mode", choices=("common", "precise"), default=None,
+                        help="'common' watches the common root of all source directories recursively; "
+                             "'precise' watches only the directories referenced by observed variables, non-recursively "
+                             "(default: common, or precise with --poll)")
+    parser.add_argument("--poll", nargs="?", type=float, const=1.0, default=None, metavar="SECONDS",
+                        help="Detect changes by polling stat snapshots every SECONDS (default 1) instead of inotify, "
+                             "for NFS and bind mounts whose changes raise no events")
+    parser.add_argument("--poll-max-interval", type=float, default=10.0, metavar="SECONDS",
+                        help="Upper bound the polling interval grows to while nothing changes")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="Only handle events on matching paths (repeatable, e.g. '*.h', 'src/')")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Ignore events on matching paths (repeatable, e.g. 'build/', '.git/', '*.o')")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="Before watching, scan the watched directories once and update observed variables "
+                             "for files created, deleted or renamed while the watcher was not running")
+    parser.add_argument("--reconcile-only", action="store_true",
+                        help="Run the reconciliation scan, write the corrected CMake files and exit without watching")
+    parser.add_argument("--backup-compress", action="store_true",
+                        help="zlib-compress the file contents kept in the backup store")
+    parser.add_argument("--backup-keep", type=int, default=50, metavar="N",
+                        help="Keep only the newest N backup snapshots (0 keeps all)")
+    parser.add_argument("--list-backups", action="store_true",
+                        help="List the backup snapshots and exit")
+    parser.add_argument("--restore", metavar="SNAPSHOT",
+                        help="Restore the CMake files of a backup snapshot ('latest' for the newest one) and exit")
+    parser.add_argument("--daemon", metavar="SOCKET",
+                        help="Watch several projects on one shared observer and accept 'add', 'remove', 'list' "
+                             "and 'stats' commands on the Unix socket SOCKET")
+    parser.add_argument("--control", metavar="SOCKET",
+                        help="Send a command to a daemon, e.g. '--control SOCKET add path/to/CMakeLists.txt'")
+    parser.add_argument("--record", metavar="PATH",
+                        help="Append every raw file event to the event log PATH")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="Feed the events of a recorded log through the update pipeline and exit")
+    parser.add_argument("--replay-paced", action="store_true",
+                        help="Replay with the original gaps between events instead of as fast as possible")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --replay or --reconcile-only, print unified diffs of the CMake files instead of writing them")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run the event pipeline on asyncio with a bounded queue and a separate writer task")
+    parser.add_argument("--queue-size", type=int, default=10000, metavar="N",
+                        help="Maximum number of queued raw events in --async mode")
+    parser.add_argument("--overflow", choices=AsyncPipeline.OVERFLOW_POLICIES, default="block",
+                        help="What to do with new events when the --async queue is full")
+    parser.add_argument("--fsync", choices=CMakeWriter.FSYNC_MODES, default="none",
+                        help="Durability of CMake rewrites: fsync nothing, the written file, or the file and its directory")
+    parser.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"), default="INFO",
+                        help="Log level; per-event messages are logged at DEBUG")
+    parser.add_argument("--log-rate", type=float, default=20.0, metavar="N",
+                        help="Maximum DEBUG/INFO log lines per second (0 disables rate limiting)")
+    parser.add_argument("--stats-interval", type=float, default=0, metavar="SECONDS",
+                        help="Log a stats line with counters and latencies every SECONDS")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="Periodically dump metrics to PATH (Prometheus text for *.prom, JSON otherwise)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve /metrics (Prometheus) and /metrics.json on 127.0.0.1:PORT")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Profile parsing and event handling with cProfile and write the stats to PATH on exit")
     args = parser.parse_args()
+    if args.watch_mode is None:
+        args.watch_mode = "precise" if args.poll else "common"
+    configure_logging(args.log_level, args.log_rate)
+    if args.control:
+        control(args.control, args.cmake_files)
+        return
+    if args.daemon:
+        run_daemon(args)
+        return
+    if len(args.cmake_files) != 1:
+        parser.error("exactly one CMake file is required")
+    args.cmake_file = args.cmake_files[0]
+    if args.dry_run and not (args.replay or args.reconcile_only):
+        parser.error("--dry-run requires --replay or --reconcile-only")
+    if args.profile:
+        PROFILER.enable()
+    if args.list_backups or args.restore:
+        manage_backups(args)
+        return
+
+    cache_file = None
+    if args.cache is not None:
+        cache_file = args.cache or os.path.join(os.path.dirname(os.path.abspath(args.cmake_file)), ".cmake_watcher_cache")
+    cmake_watcher = CMakeWatcher(args.cmake_file, cache_file=cache_file, fsync=args.fsync, dry_run=args.dry_run)
+    # Files the tool writes itself must never be routed to observed variables.
+    for output in (args.record, args.metrics_file, args.profile):
+        if output:
+            cmake_watcher.exclude_path(output)
+    cmake_watcher.parse(workers=args.parse_workers)
+    logger.info("Parsed %d CMake file(s) in %.1f ms", len(cmake_watcher.results), cmake_watcher.parse_total * 1000)
+    if cmake_watcher.parse_cache is not None:
+        logger.info("Parse cache: %d hit(s), %d miss(es)", cmake_watcher.parse_cache.hits, cmake_watcher.parse_cache.misses)
+    if args.parse_timing:
+        for path, elapsed in sorted(cmake_watcher.parse_times.items(), key=lambda item: -item[1]):
+            logger.info("  %8.2f ms  %s", elapsed * 1000, path)
 
-    cmake_watcher = CMakeWatcher(args.cmake_file)
-    cmake_watcher.parse()
+    # Snapshot all CMakeLists.txt files before starting the watcher.
+    if not args.dry_run:
+        cmake_watcher.backup_files(compress=args.backup_compress, keep=args.backup_keep)
 
-    # Backup all CMakeLists.txt files before starting the watcher.
-    cmake_watcher.backup_files()
+    watch_filter = WatchFilter(args.include, args.exclude, root=os.path.dirname(cmake_watcher.main_cmake))
+    if args.reconcile or args.reconcile_only:
+        summary = cmake_watcher.reconcile(watch_filter)
+        logger.info("Reconciled %d director(ies): %d file(s) added, %d removed, %d CMake file(s) written",
+                    summary["directories"], summary["added"], summary["removed"], len(summary["written"]))
+        if args.reconcile_only:
+            finish_one_shot(args, cmake_watcher)
+            return
+    if args.replay:
+        event_handler = FileEventHandler(cmake_watcher, debounce=args.debounce, watch_filter=watch_filter)
+        try:
+            count, elapsed = replay(args.replay, event_handler, paced=args.replay_paced)
+        except (OSError, ValueError) as e:
+            logger.error("Cannot replay %s: %s", args.replay, e)
+            return
+        stats = event_handler.stats()
+        logger.info("Replayed %d event(s) in %.3f s (%.0f events/s): %d applied, %d collapsed, %d ignored, %d echo(es)",
+                    count, elapsed, count / elapsed if elapsed else 0.0, stats['applied_events'],
+                    stats['collapsed_events'], stats['ignored_events'], stats['echo_events'])
+        finish_one_shot(args, cmake_watcher)
+        return
 
-    # Determine watch directories from the observed variables.
-    watch_dirs = cmake_watcher.get_watch_directories()
-    if not watch_dirs:
+    # Determine the watches from the observed variables.
+    schedule = cmake_watcher.get_watch_schedule(args.watch_mode, watch_filter)
+    if not schedule:
         fallback = os.path.dirname(os.path.abspath(args.cmake_file))
-        print(f"No valid watch directories found in CMake variables. Falling back to: {fallback}")
-        watch_dirs = [fallback]
+        logger.warning("No valid watch directories found in CMake variables. Falling back to: %s", fallback)
+        schedule = [(fallback, True)]
+
+    def reschedule():
+        added, removed = scheduler.sync(cmake_watcher.get_watch_schedule(args.watch_mode, watch_filter))
+        if added or removed:
+            logger.info("Watch schedule updated: +%d -%d director(ies), %s in use",
+                        len(added), len(removed), scheduler.describe())
+
+    event_handler = FileEventHandler(cmake_watcher, debounce=args.debounce, watch_filter=watch_filter,
+                                     on_schedule_change=reschedule)
+    if args.record:
+        event_handler.recorder = EventRecorder(args.record)
+    observer = create_observer(args)
+    pipeline = None
+    if args.use_async:
+        pipeline = AsyncPipeline(event_handler, max_queue=args.queue_size, overflow=args.overflow)
+        scheduler = WatchScheduler(observer, pipeline.observer_handler())
     else:
-        print("Watch directories found from CMake variables:")
-        for wd in watch_dirs:
-            print(" ", wd)
-
-    event_handler = FileEventHandler(cmake_watcher)
-    observer = Observer()
-    for directory in watch_dirs:
-        observer.schedule(event_handler, directory, recursive=True)
+        scheduler = WatchScheduler(observer, event_handler)
+    scheduler.sync(schedule)
+    cmake_watcher.schedule_dirty = False
+    logger.info("Started watching directories:")
+    for d, recursive in schedule:
+        logger.info("  %s%s", d, " (recursive)" if recursive else "")
+    logger.info("Using %s for %d scheduled directories", scheduler.describe(), len(scheduler.watches))
+
+    METRICS.gauge("cmake_files", lambda: len(cmake_watcher.results))
+    METRICS.gauge("inotify_watches", scheduler.watch_count)
+    reporter = None
+    if args.stats_interval > 0 or args.metrics_file or args.metrics_port is not None:
+        reporter = MetricsReporter(interval=args.stats_interval or 10.0, log_stats=args.stats_interval > 0,
+                                   dump_path=args.metrics_file, port=args.metrics_port).start()
+    if pipeline is not None:
+        run_async(pipeline, observer)
+    else:
+        observer.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("Stopping file watcher.")
+            observer.stop()
+        observer.join()
+        event_handler.flush()
+    cmake_watcher.save_cache()
+    cmake_watcher.save_listing()
+    if event_handler.recorder is not None:
+        event_handler.recorder.close()
+        logger.info("Recorded %d event(s) to %s", event_handler.recorder.events, args.record)
+    if reporter is not None:
+        reporter.stop()
+    if args.profile:
+        PROFILER.dump(args.profile).sort_stats("cumulative").print_stats(20)
+        logger.info("Profile written to %s", args.profile)
+    stats = event_handler.stats()
+    logger.info("Events received: %d, applied: %d, collapsed: %d",
+                stats['raw_events'], stats['applied_events'], stats['collapsed_events'])
+    logger.info("stats: %s", METRICS.stats_line())
+
+def finish_one_shot(args, cmake_watcher):
+    if args.dry_run:
+        for cmake_file, diff in unified_diffs(cmake_watcher):
+            print(diff, end="")
+    cmake_watcher.save_cache()
+
+def configure_logging(level, rate):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    if rate > 0:
+        handler.addFilter(RateLimitFilter(rate))
+    logging.basicConfig(level=getattr(logging, level), handlers=[handler])
+
+def create_observer(args):
+    if args.poll:
+        return PollingObserver(interval=args.poll, max_interval=args.poll_max_interval)
+    return Observer()
+
+def run_daemon(args):
+    observer = create_observer(args)
+    daemon = WatcherDaemon(observer, watch_mode=args.watch_mode, watch_filter=WatchFilter(args.include, args.exclude),
+                           debounce=args.debounce, parse_workers=args.parse_workers, fsync=args.fsync,
+                           cache=args.cache is not None, backup_keep=args.backup_keep,
+                           backup_compress=args.backup_compress)
+    for cmake_file in args.cmake_files:
+        daemon.add_project(cmake_file)
+    METRICS.gauge("projects", lambda: len(daemon.projects))
+    METRICS.gauge("inotify_watches", daemon.scheduler.watch_count)
+    server = daemon.serve_control(args.daemon)
+    logger.info("Daemon listening on %s with %d project(s)", args.daemon, len(daemon.projects))
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
     observer.start()
-    print("Started watching directories:")
-    for d in watch_dirs:
-        print(" ", d)
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("Stopping file watcher.")
-        observer.stop()
+        logger.info("Stopping daemon.")
+    server.shutdown()
+    server.server_close()
+    os.unlink(args.daemon)
+    observer.stop()
     observer.join()
+    daemon.shutdown()
+    logger.info("stats: %s", METRICS.stats_line())
+
+def control(socket_path, words):
+    if not words:
+        print("usage: --control SOCKET {add CMAKE_FILE [NAME] | remove NAME | list | stats}")
+        return
+    request = {"cmd": words[0]}
+    if words[0] == "add" and len(words) > 1:
+        request["cmake_file"] = os.path.abspath(words[1])
+        if len(words) > 2:
+            request["name"] = words[2]
+    elif words[0] == "remove" and len(words) > 1:
+        request["name"] = words[1]
+    print(json.dumps(send_command(socket_path, request), indent=2))
+
+def manage_backups(args):
+    project_dir = os.path.dirname(os.path.abspath(args.cmake_file))
+    store = BackupStore(os.path.join(project_dir, ".cmake_observer_backup"))
+    if args.list_backups:
+        for manifest in store.snapshots():
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["time"]))
+            print(f"{manifest['id']}  {stamp}  {manifest['reason']:<12}  {len(manifest['files'])} file(s)")
+        return
+    try:
+        restored = store.restore(args.restore, project_dir, fsync=args.fsync)
+    except KeyError:
+        logger.error("No backup snapshot %s in %s", args.restore, store.root)
+        return
+    logger.info("Restored %d file(s) from snapshot %s", len(restored), args.restore)
+    for path in restored:
+        logger.info("  %s", path)
+
+def run_async(pipeline, observer):
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, pipeline.request_stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await pipeline.run(observer)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    logger.info("Stopped file watcher. Peak queue depth: %d, dropped events: %d", pipeline.max_depth, pipeline.dropped_events)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.events import FileSystemEventHandler
+from src.event_coalescer import EventCoalescer
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+class AsyncPipeline:
+    """
+    asyncio variant of the event pipeline, with three decoupled stages:
+      - intake: the observer thread pushes raw events into a bounded asyncio.Queue,
+      - routing: a task filters the events and coalesces them until the quiet window ends,
+      - writer: a task applies each batch on an executor thread, so slow disk writes never
+        stall event intake.
+    When the intake queue is full the overflow policy decides what happens:
+    "block" makes the observer thread wait (backpressure), "drop-newest" discards the new
+    event and "drop-oldest" discards the oldest queued one.
+    """
+    OVERFLOW_POLICIES = ("block", "drop-newest", "drop-oldest")
+    _STOP = object()
+
+    def __init__(self, event_handler, max_queue=10000, overflow="block", max_batches=2):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.event_handler = event_handler
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.max_batches = max_batches
+        self.dropped_events = 0
+        self.max_depth = 0
+        self._loop = None
+        self._events = None
+        self._batches = None
+        self._stop_requested = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cmake-writer")
+
+    def observer_handler(self):
+        """Return the watchdog handler to schedule on the observer; it only enqueues events."""
+        return _QueueingHandler(self)
+
+    def queue_depth(self):
+        return self._events.qsize() if self._events is not None else 0
+
+    def submit(self, event):
+        """Called from the observer thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if self.overflow == "block":
+            future = asyncio.run_coroutine_threadsafe(self._events.put(event), loop)
+            future.result()
+        else:
+            loop.call_soon_threadsafe(self._offer, event)
+
+    def _offer(self, event):
+        try:
+            self._events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            METRICS.counter("events_dropped").inc()
+            if self.overflow == "drop-oldest":
+                self._events.get_nowait()
+                self._events.put_nowait(event)
+        self.max_depth = max(self.max_depth, self._events.qsize())
+
+    def request_stop(self):
+        """Ask run() to shut down; safe to call from any thread or a signal handler."""
+        if self._loop is not None and self._stop_requested is not None:
+            self._loop.call_soon_threadsafe(self._stop_requested.set)
+
+    async def run(self, observer=None):
+        """
+        Run the pipeline until request_stop() is called. If an observer is given it is started
+        here and stopped on shutdown before the queues are drained, so no accepted event is lost.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue(self.max_queue)
+        self._batches = asyncio.Queue(self.max_batches)
+        self._stop_requested = asyncio.Event()
+        METRICS.gauge("queue_depth", self.queue_depth)
+        router = asyncio.create_task(self._route())
+        writer = asyncio.create_task(self._write())
+        if observer is not None:
+            observer.start()
+        try:
+            await self._stop_requested.wait()
+        finally:
+            if observer is not None:
+                observer.stop()
+                # Joining may wait for an observer thread blocked on a full queue, which the router drains.
+                await self._loop.run_in_executor(None, observer.join)
+            await self._events.put(self._STOP)
+            await asyncio.gather(router, writer)
+            self._executor.shutdown(wait=True)
+
+    async def _route(self):
+        handler = self.event_handler
+        coalescer = EventCoalescer()
+        window = handler.debounce
+        first_pending = None
+        while True:
+            timeout = None
+            if coalescer.raw_events:
+                # Wait for the rest of the quiet window, but never beyond max_delay.
+                now = time.monotonic()
+                timeout = max(0.0, min(window, first_pending + handler.max_delay - now))
+            self.max_depth = max(self.max_depth, self._events.qsize())
+            try:
+                event = await asyncio.wait_for(self._events.get(), timeout)
+            except asyncio.TimeoutError:
+                event = None
+            if event is self._STOP or event is None:
+                if coalescer.raw_events:
+                    raw = coalescer.raw_events
+                    await self._batches.put((coalescer.drain(), raw))
+                    first_pending = None
+                if event is self._STOP:
+                    await self._batches.put(self._STOP)
+                    return
+                continue
+            if event.is_directory or event.event_type not in ("created", "modified", "deleted", "moved"):
+                continue
+            try:
+                change = handler.to_change(event.event_type, event.src_path, getattr(event, "dest_path", None))
+            except Exception as e:
+                # A bad event must not stop the router, or producers would block on a full queue.
+                logger.error("Error handling %s event for %s: %s", event.event_type, event.src_path, e)
+                continue
+            if change is None:
+                continue
+            coalescer.add(*change)
+            if first_pending is None:
+                first_pending = time.monotonic()
+            if window <= 0:
+                await self._batches.put((coalescer.drain(), 1))
+                first_pending = None
+
+    async def _write(self):
+        while True:
+            batch = await self._batches.get()
+            if batch is self._STOP:
+                return
+            changes, raw = batch
+            try:
+                await self._loop.run_in_executor(self._executor, self.event_handler.apply_batch, changes, raw)
+            except Exception as e:
+                logger.error("Error applying %d change(s): %s", len(changes), e)
+
+
+class _QueueingHandler(FileSystemEventHandler):
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def dispatch(self, event):
+        self.pipeline.submit(event)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from src.cmake_writer import CMakeWriter
+
+logger = logging.getLogger(__name__)
+
+class BackupStore:
+    """
+    Content-addressed history of the CMake files.
+
+    Layout under root:
+      objects/ab/cdef...     file contents named by their SHA-1 (suffix .z when zlib-compressed),
+      snapshots/<id>.json    one small manifest per snapshot: {"id", "time", "reason", "files"},
+                             where files maps paths relative to the project directory to hashes.
+    A file whose content is already stored costs nothing but its manifest entry, and a snapshot
+    identical to the previous one is not recorded again. With `keep` set only the newest `keep`
+    snapshots are kept and objects no longer referenced by any of them are deleted.
+    Snapshot ids and manifest file lists are read from disk once and then kept in memory, so a
+    store assumes it is the only writer of its root while it is in use.
+    """
+    MANIFEST_SUFFIX = ".json"
+    COMPRESSED_SUFFIX = ".z"
+
+    def __init__(self, root, compress=False, keep=None):
+        self.root = root
+        self.compress = compress
+        self.keep = keep
+        self.objects_dir = os.path.join(root, "objects")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.objects_written = 0
+        self._ids = None
+        self._files = {}
+
+    def _object_path(self, digest_hex):
+        return os.path.join(self.objects_dir, digest_hex[:2], digest_hex[2:])
+
+    def has_object(self, digest_hex):
+        path = self._object_path(digest_hex)
+        return os.path.exists(path) or os.path.exists(path + self.COMPRESSED_SUFFIX)
+
+    def put_object(self, data):
+        """Store data unless an object with the same hash exists. Returns the hex digest."""
+        digest_hex = hashlib.sha1(data).hexdigest()
+        if self.has_object(digest_hex):
+            return digest_hex
+        path = self._object_path(digest_hex)
+        if self.compress:
+            data, path = zlib.compress(data), path + self.COMPRESSED_SUFFIX
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.objects_written += 1
+        return digest_hex
+
+    def get_object(self, digest_hex):
+        path = self._object_path(digest_hex)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        with open(path + self.COMPRESSED_SUFFIX, 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def snapshot(self, base_dir, files, reason="manual"):
+        """
+        Record the current content of files, a dict {path: sha1 digest or None}. A known digest
+        whose object is already stored is taken as is; any other file is read and stored.
+        Returns the snapshot id, the id of the latest snapshot if nothing changed since, or None
+        if none of the files could be read.
+        """
+        entries = {}
+        for file_path, digest in files.items():
+            if digest is None or not self.has_object(digest.hex()):
+                try:
+                    with open(file_path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    logger.warning("Could not back up %s: %s", file_path, e)
+                    continue
+                digest_hex = self.put_object(data)
+            else:
+                digest_hex = digest.hex()
+            entries[os.path.relpath(file_path, base_dir)] = digest_hex
+        if not entries:
+            return None
+        latest = self.latest()
+        if latest is not None and self._manifest_files(latest) == entries:
+            return latest
+        snapshot_id = self._new_id()
+        manifest = {"id": snapshot_id, "time": time.time(), "reason": reason, "files": entries}
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        path = os.path.join(self.snapshots_dir, snapshot_id + self.MANIFEST_SUFFIX)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+        self._ids.append(snapshot_id)
+        self._files[snapshot_id] = entries
+        self.prune()
+        return snapshot_id
+
+    def _new_id(self):
+        now = time.time()
+        snapshot_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1e6) % 1000000:06d}"
+        ids = self._load_ids()
+        suffix = 0
+        candidate = snapshot_id
+        while candidate in ids:
+            suffix += 1
+            candidate = f"{snapshot_id}.{suffix}"
+        return candidate
+
+    def _load_ids(self):
+        if self._ids is None:
+            try:
+                names = os.listdir(self.snapshots_dir)
+            except FileNotFoundError:
+                names = []
+            self._ids = sorted(name[:-len(self.MANIFEST_SUFFIX)] for name in names
+                               if name.endswith(self.MANIFEST_SUFFIX))
+        return self._ids
+
+    def list_ids(self):
+        """Snapshot ids, oldest first."""
+        return list(self._load_ids())
+
+    def latest(self):
+        ids = self._load_ids()
+        return ids[-1] if ids else None
+
+    def _manifest_files(self, snapshot_id):
+        files = self._files.get(snapshot_id)
+        if files is None:
+            files = self._files[snapshot_id] = self.load(snapshot_id)["files"]
+        return files
+
+    def load(self, snapshot_id):
+        if snapshot_id == "latest":
+            snapshot_id = self.latest()
+            if snapshot_id is None:
+                raise KeyError("no snapshots")
+        try:
+            with open(os.path.join(self.snapshots_dir, snapshot_id + self.MANIFEST_SUFFIX)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(snapshot_id) from None
+
+    def snapshots(self):
+        """Manifests of all snapshots, oldest first."""
+        return [self.load(snapshot_id) for snapshot_id in self.list_ids()]
+
+    def restore(self, snapshot_id, base_dir, fsync="none"):
+        """Write the files of a snapshot back below base_dir, atomically. Returns the written paths."""
+        manifest = self.load(snapshot_id)
+        writer = CMakeWriter(fsync)
+        for rel_path, digest_hex in manifest["files"].items():
+            writer.stage(os.path.normpath(os.path.join(base_dir, rel_path)), self.get_object(digest_hex))
+        return sorted(path for path, (written, _) in writer.flush().items() if written)
+
+    def prune(self):
+        """Apply the retention limit. Returns the number of deleted snapshots."""
+        if not self.keep:
+            return 0
+        ids = self._load_ids()
+        expired = ids[:-self.keep]
+        if not expired:
+            return 0
+        # Only objects of the expired snapshots can have lost their last reference.
+        candidates = set()
+        for snapshot_id in expired:
+            candidates.update(self._manifest_files(snapshot_id).values())
+        for snapshot_id in expired:
+            os.unlink(os.path.join(self.snapshots_dir, snapshot_id + self.MANIFEST_SUFFIX))
+            self._files.pop(snapshot_id, None)
+        del ids[:len(expired)]
+        for snapshot_id in ids:
+            candidates.difference_update(self._manifest_files(snapshot_id).values())
+        for digest_hex in candidates:
+            self._delete_object(digest_hex)
+        return len(expired)
+
+    def _delete_object(self, digest_hex):
+        path = self._object_path(digest_hex)
+        for candidate in (path, path + self.COMPRESSED_SUFFIX):
+            try:
+                os.unlink(candidate)
+            except FileNotFoundError:
+                pass
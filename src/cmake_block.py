@@ -0,0 +1,80 @@
+import re
+from src.watch_filter import VariableRules
+
+_SPECIAL = re.compile(r'[\\"$@;\n\t\r]')
+_QUOTE_ESCAPES = {"\\": "\\\\", '"': '\\"', "$": "\\$", "@": "\\@", ";": "\\;",
+                  "\n": "\\n", "\t": "\\t", "\r": "\\r"}
+
+
+def quote(token):
+    """Escape a token for a quoted CMake argument; the lexer's unescape() is its exact inverse."""
+    if _SPECIAL.search(token) is None:
+        return token
+    return _SPECIAL.sub(lambda m: _QUOTE_ESCAPES[m.group()], token)
+
+
+def raw_argument(token, source):
+    """
+    Return the source text to keep for a parsed argument, or None if quoting the token
+    reproduces its meaning (e.g. a plain path, quoted or not).
+    """
+    if _SPECIAL.search(token) is None:
+        plain = source == token or (source[0] == '"' and source[1:-1] == token)
+        return None if plain else source
+    return None if source == f'"{quote(token)}"' else source
+
+
+class ObservedBlock:
+    """
+    A `set()` command preceded by the observe marker, as found in a cached CMake file.
+    start/end are the 0-based line span [start, end) of the command inside the file's line list,
+    so a rewrite only has to splice that span and shift the blocks that follow it.
+    """
+    __slots__ = ("var_name", "tokens", "start", "end", "indent", "newline", "rules", "raw")
+
+    def __init__(self, var_name, tokens, start, end, indent, newline="\n", patterns=(), raw=None):
+        self.var_name = var_name
+        # File tokens with quotes removed and escapes resolved, relative to the CMake file's directory.
+        self.tokens = tokens
+        # Source text of the tokens that quote() would not reproduce (escaped variable references,
+        # bracket arguments, ...), re-emitted as is so a rewrite never changes their meaning.
+        self.raw = raw or {}
+        self.start = start
+        self.end = end
+        self.indent = indent
+        self.newline = newline
+        # File-name patterns from the marker line, compiled once and shared between blocks.
+        self.rules = VariableRules.get(patterns)
+
+    @property
+    def start_line(self):
+        # Human-readable line number of the set( line.
+        return self.start + 1
+
+    def argument(self, token):
+        """The source text of one token in a rendered set() command."""
+        source = self.raw.get(token)
+        return source if source is not None else f'"{quote(token)}"'
+
+    @property
+    def var_value(self):
+        return " ".join(self.argument(token) for token in self.tokens)
+
+    def render(self, tokens=None):
+        """Return the lines of the set() command, one file per line."""
+        tokens = self.tokens if tokens is None else tokens
+        nl = self.newline
+        return ([f"{self.indent}set({self.var_name}{nl}"]
+                + [f"{self.argument(token)}{nl}" for token in tokens]
+                + [f"){nl}"])
+
+    def __iter__(self):
+        # Unpacks like the (var_name, var_value, start_line, command_block, indent) tuples used before.
+        yield self.var_name
+        yield self.var_value
+        yield self.start_line
+        yield "".join(self.render()).rstrip("\r\n")
+        yield self.indent
+
+    def __repr__(self):
+        return f"ObservedBlock({self.var_name!r}, lines {self.start + 1}-{self.end}, {len(self.tokens)} tokens)"
@@ -0,0 +1,144 @@
+"""
+Single-pass lexer for the CMake language, as far as the watcher needs it: command invocations
+with their arguments, and comments.
+
+Handles quoted arguments (with escapes and line continuations), unquoted arguments,
+bracket arguments ([[...]], [=[...]=], ...), line comments, bracket comments (#[[...]]) and
+nested parentheses, which CMake passes on as literal "(" and ")" arguments.
+Variable references such as ${VAR} are kept verbatim; nothing is evaluated. Escape sequences
+are resolved, so \${VAR} and ${VAR} give the same argument; the source text of every argument
+is kept as well for callers that must tell them apart.
+"""
+import re
+
+_TOP = re.compile(r'''
+    [ \t\r\n]+
+  | (?P<bracket_comment>\#\[(?P<comment_eq>=*)\[)
+  | (?P<comment>\#[^\r\n]*)
+  | (?P<command>[A-Za-z_][A-Za-z0-9_]*)[ \t]*\(
+  | .
+''', re.VERBOSE | re.DOTALL)
+
+_ARGUMENT = re.compile(r'''
+    [ \t\r\n]+
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<bracket>\[(?P<bracket_eq>=*)\[)
+  | (?P<bracket_comment>\#\[(?P<comment_eq>=*)\[)
+  | \#[^\r\n]*
+  | "(?P<quoted>(?:[^"\\]|\\.)*)"
+  | (?P<unquoted>(?:[^\s()\#"\\]|\\.)+)
+  | .
+''', re.VERBOSE | re.DOTALL)
+
+_ESCAPE = re.compile(r'\\(\r?\n|.)', re.DOTALL)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def _unescape(match):
+    char = match.group(1)
+    if char in ("\n", "\r\n"):
+        # A backslash at the end of a line inside a quoted argument continues the line.
+        return ""
+    return _ESCAPES.get(char, char)
+
+
+def unescape(value):
+    return _ESCAPE.sub(_unescape, value) if "\\" in value else value
+
+
+class Comment:
+    __slots__ = ("text", "start", "end")
+
+    def __init__(self, text, start, end):
+        self.text = text
+        self.start = start
+        self.end = end
+
+
+class Command:
+    """
+    A command invocation; start/end are character offsets of its name and of the end of its ')'.
+    raw holds the source text of each argument, quotes and brackets included.
+    """
+    __slots__ = ("name", "args", "raw", "start", "end")
+
+    def __init__(self, name, args, start, end, raw=None):
+        self.name = name
+        self.args = args
+        self.raw = raw
+        self.start = start
+        self.end = end
+
+
+def _bracket_end(text, pos, eq):
+    """Offset of the closing ]=*] of a bracket opened just before pos, and the offset after it."""
+    close = "]" + eq + "]"
+    end = text.find(close, pos)
+    if end == -1:
+        return len(text), len(text)
+    return end, end + len(close)
+
+
+def lex(text):
+    """Return the comments and commands of text, in order."""
+    items = []
+    pos = 0
+    length = len(text)
+    top = _TOP.match
+    while pos < length:
+        m = top(text, pos)
+        pos = m.end()
+        if m.group("command") is not None:
+            args, raw, pos = _lex_arguments(text, pos)
+            items.append(Command(m.group("command"), args, m.start(), pos, raw))
+        elif m.group("comment") is not None:
+            items.append(Comment(m.group("comment"), m.start(), pos))
+        elif m.group("bracket_comment") is not None:
+            _, pos = _bracket_end(text, pos, m.group("comment_eq"))
+    return items
+
+
+def _lex_arguments(text, pos):
+    """
+    Read the arguments of a command whose '(' ends just before pos.
+    Returns (args, source text of the args, offset after ')').
+    """
+    args = []
+    raw = []
+    depth = 0
+    length = len(text)
+    argument = _ARGUMENT.match
+    while pos < length:
+        m = argument(text, pos)
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "quoted":
+            args.append(unescape(m.group("quoted")))
+            raw.append(m.group())
+        elif kind == "unquoted":
+            args.append(unescape(m.group("unquoted")))
+            raw.append(m.group())
+        elif kind == "bracket_eq" or kind == "bracket":
+            end, pos = _bracket_end(text, pos, m.group("bracket_eq"))
+            content = text[m.end():end]
+            # As in CMake, a newline right after the opening bracket is not part of the argument.
+            if content.startswith("\r\n"):
+                content = content[2:]
+            elif content.startswith("\n"):
+                content = content[1:]
+            args.append(content)
+            raw.append(text[m.start():pos])
+        elif kind == "comment_eq" or kind == "bracket_comment":
+            _, pos = _bracket_end(text, pos, m.group("comment_eq"))
+        elif kind == "open":
+            depth += 1
+            args.append("(")
+            raw.append("(")
+        elif kind == "close":
+            if depth == 0:
+                return args, raw, pos
+            depth -= 1
+            args.append(")")
+            raw.append(")")
+    return args, raw, pos
@@ -1,143 +1,599 @@
+import hashlib
+import io
+import json
+import logging
 import os
 import re
-import shutil
-import shlex  # for splitting while preserving quoted tokens
+import time
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import accumulate
+from src.backup_store import BackupStore
+from src.cmake_block import ObservedBlock, raw_argument
+from src.cmake_lexer import Comment, lex
+from src.cmake_writer import CMakeWriter
+from src.metrics import METRICS, PROFILER
+from src.parse_cache import ParseCache
+
+logger = logging.getLogger(__name__)
 
 class CMakeWatcher:
     SPECIAL_MARKER = "#!CMAKE_WATCHER_OBSERVE"
+    # Variable references, generator expressions and configure_file() @VAR@ substitutions.
+    _EXPRESSION_RE = re.compile(r'\$\{|\$<|@[A-Za-z_][A-Za-z0-9_]*@')
 
-    def __init__(self, main_cmake):
+    def __init__(self, main_cmake, cache_file=None, fsync="none", dry_run=False):
         self.main_cmake = os.path.abspath(main_cmake)
-        # Maps CMake file paths to list of observed variables.
-        # Each tuple: (var_name, var_value, start_line, command_block, indent)
+        # Maps CMake file paths to the list of ObservedBlock objects found in them.
         self.results = {}
-        # Cache file content as a list of lines to avoid repeated disk reads.
+        # Cache file content as a list of lines (line endings preserved) to avoid repeated disk reads.
+        # Files restored from the parse cache are only read when they are first rewritten.
         self.file_cache = {}
+        # SHA-1 of the content the blocks of each CMake file were parsed from.
+        self.content_hashes = {}
+        # All rewrites go through the writer: atomic replace, one write per file per batch.
+        # In dry-run mode the updated content only lives in file_cache.
+        self.writer = CMakeWriter(fsync, dry_run)
+        # Optional on-disk cache of parse results (see ParseCache).
+        self.parse_cache = ParseCache(os.path.abspath(cache_file)) if cache_file else None
         # Track modification times of the CMake files.
         self.mod_times = {}
         self.visited = set()
+        # Seconds spent reading and scanning each CMake file, and the wall time of the last parse().
+        self.parse_times = {}
+        self.parse_total = 0.0
+        self.backup_root = os.path.join(os.path.dirname(self.main_cmake), ".cmake_observer_backup")
+        # File names of the directories of observed variables, as last seen by reconcile() or
+        # save_listing(); reconcile() only adds files that appeared since.
+        self.listing_file = os.path.join(os.path.dirname(self.main_cmake), ".cmake_watcher_listing")
+        # Files the tool itself writes (listing, event log, ...); never routed to observed variables.
+        self.excluded_paths = set()
+        self.exclude_path(self.listing_file)
+        # Set by backup_files(); once set, a snapshot is taken before every batch of rewrites.
+        self.backup_store = None
+        # (content hash, mtime_ns) of the last write this watcher made to each CMake file,
+        # used to recognise the file events caused by our own rewrites.
+        self.own_writes = {}
+        # Inverted indexes used to route file events without rescanning every variable.
+        # Both map to a set of (cmake_file, block) entries; the block carries its own span.
+        self.dir_index = {}   # watched directory -> owning blocks
+        self.path_index = {}  # normalized absolute source path -> owning blocks
+        # Keys contributed by each block, so its entries can be dropped on re-index.
+        self._index_keys = {}
+        # add_subdirectory graph: CMake file -> CMake files of its existing subdirectories.
+        self.subdirectories = {}
+        # Set whenever the directories referenced by observed variables or the set of parsed
+        # CMake files change, i.e. whenever get_watch_schedule() may return something new.
+        self.schedule_dirty = False
+        self.parse_workers = None
+        # Merged include patterns of all observed variables (see rejects_event); None accepts everything.
+        self.rules_gate = None
 
-    def parse(self):
-        self._parse_recursive(self.main_cmake)
+    def parse(self, workers=None):
+        """
+        Parse the main CMake file and every file reachable through add_subdirectory.
+        Each file is read and scanned once; subdirectories are parsed concurrently on a
+        thread pool of `workers` threads (None lets the executor pick), while all shared
+        state is updated from the calling thread.
+        """
+        started = time.perf_counter()
+        self.parse_workers = workers
+        if self.parse_cache is not None:
+            self.parse_cache.load()
+        with PROFILER.section():
+            self._parse_tree([self.main_cmake])
+        self.parse_total = time.perf_counter() - started
+        self.save_cache()
 
-    def _parse_recursive(self, file_path):
-        file_path = os.path.abspath(file_path)
-        if file_path in self.visited:
+    def _parse_tree(self, roots):
+        """Parse the given CMake files and all not yet visited files below them."""
+        with ThreadPoolExecutor(max_workers=self.parse_workers) as pool:
+            pending = set()
+            for root in roots:
+                self.visited.add(root)
+                pending.add(pool.submit(self._parse_file, root))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, parsed, children, elapsed = future.result()
+                    self.parse_times[file_path] = elapsed
+                    METRICS.histogram("parse_seconds").observe(elapsed)
+                    if parsed is None:
+                        continue
+                    lines, blocks, subdirs, st, digest, cached = parsed
+                    self.results[file_path] = blocks
+                    if lines is not None:
+                        self.file_cache[file_path] = lines
+                    self.content_hashes[file_path] = digest
+                    self.mod_times[file_path] = st.st_mtime
+                    self.subdirectories[file_path] = children
+                    self._index_file(file_path)
+                    self.schedule_dirty = True
+                    if self.parse_cache is not None:
+                        if cached:
+                            self.parse_cache.hits += 1
+                        else:
+                            self.parse_cache.misses += 1
+                        # Re-key entries that were only touched, and store freshly parsed files.
+                        if self.parse_cache.get(file_path, st) is None:
+                            self.parse_cache.put(file_path, st, digest, blocks, subdirs)
+                    for child in children:
+                        if child not in self.visited:
+                            self.visited.add(child)
+                            pending.add(pool.submit(self._parse_file, child))
+        self._build_rules_gate()
+
+    def save_cache(self):
+        """Write the parse cache, if enabled, keeping entries for the files of the current tree only."""
+        if self.parse_cache is None:
             return
-        self.visited.add(file_path)
+        # Files we rewrote can be stored as they are; any other stale entry is still safe to keep
+        # because it is checked against the content hash on the next start. In dry-run mode the
+        # files on disk were never rewritten, so nothing is re-keyed.
+        rewritten = {} if self.writer.dry_run else self.own_writes
+        for cmake_file, (digest, mtime_ns) in rewritten.items():
+            if cmake_file not in self.results:
+                continue
+            try:
+                st = os.stat(cmake_file)
+            except OSError:
+                continue
+            if st.st_mtime_ns == mtime_ns and self.parse_cache.get(cmake_file, st) is None:
+                subdirs = self._parse_lines(self.file_cache[cmake_file])[1]
+                self.parse_cache.put(cmake_file, st, digest, self.results[cmake_file], subdirs)
+        try:
+            self.parse_cache.save(keep=self.results.keys())
+        except OSError as e:
+            logger.warning("Could not write parse cache %s: %s", self.parse_cache.path, e)
+
+    def _parse_file(self, file_path):
+        """
+        Read and scan one CMake file. Runs on a worker thread and touches no shared state.
+        Returns (file_path, (lines, blocks, subdirs, stat, digest, from_cache) or None on error,
+        child CMake files, seconds). lines is None when the entry came from the parse cache
+        without reading the file.
+        """
+        started = time.perf_counter()
         try:
-            observed_vars = self._parse_observed_variables(file_path)
+            st = os.stat(file_path)
+            lines = digest = entry = None
+            if self.parse_cache is not None:
+                entry = self.parse_cache.get(file_path, st)
+            if entry is None:
+                lines, digest = self._read_file(file_path)
+                if self.parse_cache is not None:
+                    entry = self.parse_cache.get_by_hash(file_path, digest)
+            if entry is not None:
+                blocks, subdirs, digest = self.parse_cache.decode(entry)
+            else:
+                blocks, subdirs = self._parse_lines(lines)
         except Exception as e:
-            print(f"Error parsing {file_path}: {e}")
-            return
-        self.results[file_path] = observed_vars
-        with open(file_path, 'r') as f:
-            self.file_cache[file_path] = f.readlines()
-        self.mod_times[file_path] = os.path.getmtime(file_path)
-        subdirs = self._parse_add_subdirectory(file_path)
+            logger.error("Error parsing %s: %s", file_path, e)
+            return file_path, None, [], time.perf_counter() - started
+        children = self._resolve_children(file_path, subdirs)
+        parsed = (lines, blocks, subdirs, st, digest, entry is not None)
+        return file_path, parsed, children, time.perf_counter() - started
+
+    @staticmethod
+    def _resolve_children(file_path, subdirs):
+        """Return the existing CMakeLists.txt files of the add_subdirectory() arguments of file_path."""
         base_dir = os.path.dirname(file_path)
+        children = []
         for sub in subdirs:
-            sub_dir = os.path.join(base_dir, sub)
-            sub_cmake = os.path.join(sub_dir, 'CMakeLists.txt')
-            if os.path.exists(sub_cmake):
-                self._parse_recursive(sub_cmake)
-
-    def _parse_observed_variables(self, file_path):
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
+            sub_cmake = os.path.normpath(os.path.join(base_dir, sub, 'CMakeLists.txt'))
+            if os.path.exists(sub_cmake) and sub_cmake not in children:
+                children.append(sub_cmake)
+        return children
+
+    @staticmethod
+    def _read_file(file_path):
+        """Return the lines of a CMake file and the SHA-1 of its content."""
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        # newline='' keeps the original line endings so untouched lines are written back byte-identical.
+        lines = io.StringIO(data.decode('utf-8'), newline='').readlines()
+        return lines, hashlib.sha1(data).digest()
+
+    def _lines(self, cmake_file):
+        """Return the cached lines of cmake_file, reading them if it was restored from the parse cache."""
+        lines = self.file_cache.get(cmake_file)
+        if lines is None:
+            lines, digest = self._read_file(cmake_file)
+            if digest != self.content_hashes.get(cmake_file):
+                # The cached parse does not describe this content; parse it for real.
+                self._refresh_cache(cmake_file, lines=lines, digest=digest)
+            self.file_cache[cmake_file] = lines
+        return lines
+
+    def _parse_lines(self, lines):
+        """
+        Single pass over the lines of a CMake file with the CMake lexer.
+        Returns the observed set() blocks and the arguments of the add_subdirectory() calls.
+        """
         observed_vars = []
-        i = 0
-        marker_found = False
-        total_lines = len(lines)
-        while i < total_lines:
-            line = lines[i]
-            if self.SPECIAL_MARKER in line:
-                marker_found = True
-                i += 1
+        subdirs = []
+        # Offset just past the end of each line, to map command offsets back to line numbers.
+        line_ends = list(accumulate(map(len, lines)))
+        patterns = None
+        for item in lex("".join(lines)):
+            if isinstance(item, Comment):
+                marker = item.text.find(self.SPECIAL_MARKER)
+                if marker != -1:
+                    # Anything after the marker is a list of file-name patterns for the variable.
+                    patterns = item.text[marker + len(self.SPECIAL_MARKER):].split()
                 continue
-            m = re.search(r'^(\s*)set\s*\(', line, re.IGNORECASE)
-            if m:
-                indent = m.group(1)
-                start_line = i + 1  # human-readable line number
-                command_block = line.rstrip("\n")
-                paren_count = line.count('(') - line.count(')')
-                i += 1
-                while paren_count > 0 and i < total_lines:
-                    command_block += "\n" + lines[i].rstrip("\n")
-                    paren_count += lines[i].count('(') - lines[i].count(')')
-                    i += 1
-                if marker_found:
-                    try:
-                        inner = command_block.split("(", 1)[1].rsplit(")", 1)[0].strip()
-                        tokens = inner.split()
-                        if tokens:
-                            var_name = tokens[0]
-                            var_value = " ".join(tokens[1:]) if len(tokens) > 1 else ""
-                            observed_vars.append((var_name, var_value, start_line, command_block, indent))
-                    except Exception:
-                        pass
-                    marker_found = False
+            name = item.name.lower()
+            if name == "add_subdirectory":
+                if item.args:
+                    subdirs.append(item.args[0])
+                continue
+            if name != "set" or patterns is None:
                 continue
-            i += 1
-        return observed_vars
+            block_patterns, patterns = patterns, None
+            start = bisect_right(line_ends, item.start)
+            end = bisect_right(line_ends, item.end - 1) + 1
+            line = lines[start]
+            indent = line[:item.start - (line_ends[start - 1] if start else 0)]
+            # Blocks are rewritten as whole lines, so set( must open its line.
+            if indent.strip() or not item.args:
+                continue
+            newline = "\r\n" if line.endswith("\r\n") else "\n"
+            files = []
+            raw = {}
+            for arg, source in zip(item.args[1:], item.raw[1:]):
+                token = os.path.normpath(arg)
+                files.append(token)
+                source = raw_argument(arg, source)
+                if source is not None:
+                    raw.setdefault(token, source)
+            observed_vars.append(ObservedBlock(item.args[0], files, start, end, indent, newline, block_patterns, raw))
+        return observed_vars, subdirs
 
-    def _parse_add_subdirectory(self, file_path):
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-        subdirs = []
-        i = 0
-        total_lines = len(lines)
-        while i < total_lines:
-            line = lines[i]
-            m = re.search(r'\badd_subdirectory\s*\(', line, re.IGNORECASE)
-            if m:
-                command_block = line.rstrip("\n")
-                paren_count = line.count('(') - line.count(')')
-                i += 1
-                while paren_count > 0 and i < total_lines:
-                    command_block += " " + lines[i].strip()
-                    paren_count += lines[i].count('(') - lines[i].count(')')
-                    i += 1
-                try:
-                    inner = command_block.split("(", 1)[1].rsplit(")", 1)[0].strip()
-                    parts = inner.split()
-                    if parts:
-                        subdirs.append(parts[0])
-                except Exception:
-                    pass
-            else:
-                i += 1
-        return subdirs
+    def _drop_index_keys(self, entry, dirs, paths):
+        for index, keys in ((self.dir_index, dirs), (self.path_index, paths)):
+            for key in keys:
+                entries = index.get(key)
+                if entries is None:
+                    continue
+                entries.discard(entry)
+                if not entries:
+                    del index[key]
+                    if index is self.dir_index:
+                        self.schedule_dirty = True
+
+    def _unindex_block(self, cmake_file, block):
+        dirs, paths = self._index_keys.pop(block, ((), ()))
+        self._drop_index_keys((cmake_file, block), dirs, paths)
+
+    def _index_block(self, cmake_file, block):
+        """(Re)index a block, touching only the keys that were added or dropped since it was last indexed."""
+        base_dir = os.path.dirname(cmake_file)
+        entry = (cmake_file, block)
+        paths = {os.path.normpath(os.path.join(base_dir, token)) for token in block.tokens}
+        dirs = {os.path.dirname(path) for path in paths}
+        old_dirs, old_paths = self._index_keys.get(block, (set(), set()))
+        for path in paths - old_paths:
+            self.path_index.setdefault(path, set()).add(entry)
+        for directory in dirs - old_dirs:
+            if directory not in self.dir_index:
+                self.dir_index[directory] = set()
+                self.schedule_dirty = True
+            self.dir_index[directory].add(entry)
+        self._drop_index_keys(entry, old_dirs - dirs, old_paths - paths)
+        self._index_keys[block] = (dirs, paths)
+
+    def _unindex_file(self, cmake_file):
+        for block in self.results.get(cmake_file, []):
+            self._unindex_block(cmake_file, block)
+
+    def _index_file(self, cmake_file):
+        """(Re)build the index entries contributed by the observed variables of cmake_file."""
+        for block in self.results.get(cmake_file, []):
+            self._index_block(cmake_file, block)
+
+    def _refresh_cache(self, cmake_file, mod_time=None, lines=None, digest=None):
+        """
+        Reload cmake_file from disk and re-derive its blocks and index entries.
+        Only this file is parsed again: subdirectories that appeared in it are parsed and
+        attached, and subtrees no longer reachable from the main CMake file are detached.
+        """
+        if lines is None:
+            lines, digest = self._read_file(cmake_file)
+        old_names = {block.var_name for block in self.results.get(cmake_file, [])}
+        self._unindex_file(cmake_file)
+        self.file_cache[cmake_file] = lines
+        self.content_hashes[cmake_file] = digest
+        self.mod_times[cmake_file] = os.path.getmtime(cmake_file) if mod_time is None else mod_time
+        blocks, subdirs = self._parse_lines(lines)
+        self.results[cmake_file] = blocks
+        self._index_file(cmake_file)
+        new_names = {block.var_name for block in blocks}
+        if new_names != old_names:
+            added = ", ".join(sorted(new_names - old_names)) or "-"
+            removed = ", ".join(sorted(old_names - new_names)) or "-"
+            logger.info("Observed variables changed in %s: added %s; removed %s", cmake_file, added, removed)
+
+        children = self._resolve_children(cmake_file, subdirs)
+        old_children = self.subdirectories.get(cmake_file, [])
+        self.subdirectories[cmake_file] = children
+        attached = [child for child in children if child not in self.visited]
+        if attached:
+            self._parse_tree(attached)
+            logger.info("Attached %d subdirectory CMake file(s) from %s", len(attached), cmake_file)
+        if set(old_children) - set(children):
+            self._detach_unreachable()
+        self._build_rules_gate()
+
+    def _build_rules_gate(self):
+        """
+        Merge the include patterns of every observed variable into one precompiled matcher.
+        The names of the parsed CMake files are always let through so their edits are seen.
+        If any variable takes every file name there is no gate.
+        """
+        sources = []
+        for blocks in self.results.values():
+            for block in blocks:
+                if block.rules.include_source is None:
+                    self.rules_gate = None
+                    return
+                sources.append(block.rules.include_source)
+        if not sources:
+            self.rules_gate = None
+            return
+        sources.extend(re.escape(os.path.basename(cmake_file)) + r'\Z' for cmake_file in self.results)
+        self.rules_gate = re.compile("|".join(sorted(set(sources))))
+
+    def rejects_event(self, file_path, new_file_path=None):
+        """
+        Return True if no observed variable can take the file(s) of an event, judged by file name
+        alone. This runs before any path normalization, so churn on object files, editor swap
+        files and the like is dropped at the cost of one regex match.
+        """
+        gate = self.rules_gate
+        if gate is None:
+            return False
+        if gate.match(file_path[file_path.rfind(os.sep) + 1:]):
+            return False
+        return new_file_path is None or gate.match(new_file_path[new_file_path.rfind(os.sep) + 1:]) is None
+
+    def _detach_unreachable(self):
+        """Forget every parsed CMake file that is no longer reachable from the main CMake file."""
+        reachable = set()
+        stack = [self.main_cmake]
+        while stack:
+            cmake_file = stack.pop()
+            if cmake_file in reachable:
+                continue
+            reachable.add(cmake_file)
+            stack.extend(self.subdirectories.get(cmake_file, []))
+        detached = [cmake_file for cmake_file in self.results if cmake_file not in reachable]
+        for cmake_file in detached:
+            self._unindex_file(cmake_file)
+            for state in (self.results, self.file_cache, self.content_hashes, self.mod_times,
+                          self.subdirectories, self.own_writes):
+                state.pop(cmake_file, None)
+            self.visited.discard(cmake_file)
+        if detached:
+            self.schedule_dirty = True
+            logger.info("Detached %d CMake file(s) no longer reachable through add_subdirectory()", len(detached))
+        return detached
+
+    def is_cmake_file(self, file_path):
+        return os.path.normpath(file_path) in self.results
+
+    def reload_cmake_file(self, cmake_file):
+        """
+        Re-parse one CMake file of the tree after it was edited externally.
+        Returns True if its content changed since it was last parsed or written.
+        """
+        cmake_file = os.path.normpath(cmake_file)
+        if cmake_file not in self.results:
+            return False
+        try:
+            lines, digest = self._read_file(cmake_file)
+            mod_time = os.path.getmtime(cmake_file)
+        except OSError:
+            # Deleted or being replaced; the event for the new file triggers another reload.
+            return False
+        if digest == self.content_hashes.get(cmake_file) and cmake_file in self.file_cache:
+            self.mod_times[cmake_file] = mod_time
+            return False
+        self._refresh_cache(cmake_file, mod_time=mod_time, lines=lines, digest=digest)
+        METRICS.counter("cmake_reloads").inc()
+        logger.info("Reloaded %s", cmake_file)
+        return True
+
+    def _ensure_fresh(self, cmake_file):
+        """Reload cmake_file if it was changed externally. Returns False if it cannot be read."""
+        try:
+            current_mod = os.path.getmtime(cmake_file)
+        except Exception:
+            return False
+        if current_mod > self.mod_times.get(cmake_file, 0):
+            self._refresh_cache(cmake_file, mod_time=current_mod)
+        elif cmake_file not in self.file_cache:
+            # Files restored from the parse cache are read (and verified) before their first rewrite.
+            try:
+                self._lines(cmake_file)
+            except OSError:
+                return False
+        return True
+
+    def _apply_event(self, cmake_file, block, event_type, file_path, new_file_path=None):
+        """
+        Apply one event to a block's file list and splice the re-rendered set() command into the
+        cached lines of cmake_file. Only the block's span is touched; the blocks after it are shifted.
+        Returns True if the block changed.
+        """
+        rules = block.rules
+        if rules:
+            # Files whose names the variable does not take are never added; moving a listed file
+            # to such a name removes it.
+            if event_type == "moved" and not rules.accepts(os.path.basename(new_file_path)):
+                event_type, new_file_path = "deleted", None
+            elif event_type in ("created", "modified") and not rules.accepts(os.path.basename(file_path)):
+                return False
+        base_dir = os.path.dirname(cmake_file)
+        current_files = block.tokens
+        rel_event = os.path.normpath(os.path.relpath(file_path, base_dir))
+        rel_new = os.path.normpath(os.path.relpath(new_file_path, base_dir)) if new_file_path else None
+
+        updated_files = None
+        if event_type in ("created", "modified"):
+            if rel_event not in current_files:
+                updated_files = current_files + [rel_event]
+        elif event_type == "deleted":
+            if rel_event in current_files:
+                updated_files = [f for f in current_files if f != rel_event]
+        elif event_type == "moved" and rel_new is not None:
+            if rel_event in current_files:
+                if rel_new in current_files:
+                    updated_files = [f for f in current_files if f != rel_event]
+                else:
+                    updated_files = [rel_new if f == rel_event else f for f in current_files]
+            elif rel_new not in current_files:
+                updated_files = current_files + [rel_new]
+        if updated_files is None:
+            return False
+        self._splice_block(cmake_file, block, updated_files)
+        return True
+
+    def _splice_block(self, cmake_file, block, updated_files):
+        """Replace the block's file list, re-rendering only its span in the cached lines."""
+        lines = self._lines(cmake_file)
+        new_cmd = block.render(updated_files)
+        delta = len(new_cmd) - (block.end - block.start)
+        lines[block.start:block.end] = new_cmd
+        if delta:
+            for other in self.results[cmake_file]:
+                if other.start >= block.end:
+                    other.start += delta
+                    other.end += delta
+        block.end += delta
+        block.tokens = updated_files
+        if block.raw:
+            block.raw = {token: block.raw[token] for token in updated_files if token in block.raw}
+        self._index_block(cmake_file, block)
+
+    def _stage_file(self, cmake_file):
+        """Hand the cached content of cmake_file to the writer; nothing is written before _flush_writes()."""
+        data = "".join(self.file_cache[cmake_file]).encode('utf-8')
+        self.content_hashes[cmake_file] = hashlib.sha1(data).digest()
+        self.writer.stage(cmake_file, data)
+
+    def _flush_writes(self):
+        """Write every staged CMake file once. Returns the files that were actually written."""
+        if self.backup_store is not None and self.writer.pending and not self.writer.dry_run:
+            try:
+                self.backup_store.snapshot(os.path.dirname(self.main_cmake),
+                                           {cmake_file: None for cmake_file in self.writer.pending}, "before-write")
+            except OSError as e:
+                logger.warning("Could not take a backup snapshot: %s", e)
+        written_files = []
+        for cmake_file, (written, st) in self.writer.flush().items():
+            self.mod_times[cmake_file] = st.st_mtime
+            if written:
+                self.own_writes[cmake_file] = (self.content_hashes[cmake_file], st.st_mtime_ns)
+                # The events of a write through a symlink name the link's target.
+                real_path = os.path.realpath(cmake_file)
+                if real_path != cmake_file:
+                    self.own_writes[real_path] = self.own_writes[cmake_file]
+                written_files.append(cmake_file)
+        METRICS.counter("files_rewritten").inc(len(written_files))
+        return written_files
+
+    def _write_file(self, cmake_file):
+        self._stage_file(cmake_file)
+        return bool(self._flush_writes())
+
+    def is_own_write(self, file_path):
+        """Return True if file_path still holds exactly what this watcher last wrote to it."""
+        record = self.own_writes.get(file_path)
+        if record is None:
+            return False
+        digest, mtime_ns = record
+        try:
+            st = os.stat(file_path)
+            if st.st_mtime_ns == mtime_ns:
+                return True
+            with open(file_path, 'rb') as f:
+                same = hashlib.sha1(f.read()).digest() == digest
+        except OSError:
+            return False
+        if same:
+            self.own_writes[file_path] = (digest, st.st_mtime_ns)
+        return same
+
+    def exclude_path(self, file_path):
+        """Never route events on file_path or on its ".tmp" sibling, e.g. an output file of the tool."""
+        file_path = os.path.normpath(os.path.abspath(file_path))
+        self.excluded_paths.update((file_path, file_path + ".tmp"))
+
+    def is_excluded(self, file_path):
+        """CMake files of the project, the writer's temporary files, the parse cache, the files
+        registered with exclude_path() and the backup folder are never routed to observed variables."""
+        file_path = os.path.normpath(file_path)
+        if CMakeWriter.is_temp_file(file_path) or file_path in self.excluded_paths:
+            return True
+        if self.parse_cache is not None and file_path in (self.parse_cache.path, self.parse_cache.path + ".tmp"):
+            return True
+        return (file_path in self.results or file_path == self.backup_root
+                or file_path.startswith(self.backup_root + os.sep))
+
+    def _route(self, event_type, file_path):
+        """Return the index bucket holding the (cmake_file, block) entries that own an event."""
+        norm_event = os.path.normpath(file_path)
+        if event_type == "deleted":
+            return self.path_index, norm_event
+        return self.dir_index, os.path.dirname(norm_event)
+
+    def apply_events(self, changes):
+        """
+        Apply a batch of (event_type, file_path, new_file_path) changes in order.
+        Every affected block is updated in memory first and each modified CMake file is
+        written once at the end (files whose content ends up unchanged are not written).
+        Returns the list of CMake files that were written.
+        """
+        dirty = {}
+        checked = set()
+        for event_type, file_path, new_file_path in changes:
+            if self.rejects_event(file_path, new_file_path):
+                continue
+            if self.is_excluded(file_path) or (new_file_path and self.is_excluded(new_file_path)):
+                continue
+            index, key = self._route(event_type, file_path)
+            entries = index.get(key)
+            if not entries:
+                continue
+            # Reload externally edited files first; their blocks are replaced, so route again afterwards.
+            stale = {cmake_file for cmake_file, _ in entries} - checked
+            for cmake_file in stale:
+                if not self._ensure_fresh(cmake_file):
+                    continue
+                checked.add(cmake_file)
+            METRICS.counter("events_routed").inc()
+            for cmake_file, block in list(index.get(key, ())):
+                if cmake_file not in checked:
+                    continue
+                if self._apply_event(cmake_file, block, event_type, file_path, new_file_path):
+                    dirty.setdefault(cmake_file, set()).add(block.var_name)
+        for cmake_file in dirty:
+            self._stage_file(cmake_file)
+        written = self._flush_writes()
+        for cmake_file in written:
+            logger.info("Modified variable(s) %s in %s", ", ".join(repr(v) for v in sorted(dirty[cmake_file])), cmake_file)
+        return written
 
     def update_variable_by_file_event(self, event_type, file_path, new_file_path=None):
         """
-        For each observed variable in the parsed CMake files, if the event file's directory matches
-        the directory of any file in the variable's file list, update that variable.
+        Route a file event to the observed variables that own it, using the inverted index.
+        A variable owns an event if any file in its list lives in the event's directory
+        (deleted events only need the variables that actually list the file).
         For created/modified events, add file_path if not present.
         For deleted events, remove file_path if present.
         For moved events, replace file_path with new_file_path.
         """
-        import shlex
-        updated_any = False
-        norm_event = os.path.normpath(file_path)
-        event_dir = os.path.dirname(norm_event)
-        for cmake_file, var_list in self.results.items():
-            base_dir = os.path.dirname(cmake_file)
-            for variable, var_value, start_line, command_block, indent in var_list:
-                # Get file tokens from the variable value.
-                try:
-                    tokens = shlex.split(var_value)
-                except Exception:
-                    tokens = var_value.split()
-                # Resolve tokens relative to the directory of the CMake file.
-                file_paths = [os.path.normpath(os.path.join(base_dir, token.strip('"'))) for token in tokens]
-                # Check if any file in the variable's list is from the same directory as the event.
-                match = any(os.path.dirname(fp) == event_dir for fp in file_paths)
-                if match:
-                    res = self.update_variable(variable, event_type, file_path, new_file_path)
-                    if res:
-                        updated_any = True
-        return updated_any
+        return bool(self.apply_events([(event_type, file_path, new_file_path)]))
 
     def update_variable(self, variable, event_type, file_path, new_file_path=None):
         """
@@ -147,106 +603,152 @@ class CMakeWatcher:
           - For "moved": replace file_path with new_file_path (both relative) if applicable.
         """
         modified_any = False
-
-        for cmake_file, vars_list in self.results.items():
-            # Check if the file was changed externally; if so, reload its content.
-            try:
-                current_mod = os.path.getmtime(cmake_file)
-            except Exception:
+        for cmake_file in list(self.results):
+            if not self._ensure_fresh(cmake_file):
                 continue
-            if current_mod > self.mod_times.get(cmake_file, 0):
-                with open(cmake_file, 'r') as f:
-                    self.file_cache[cmake_file] = f.readlines()
-                self.mod_times[cmake_file] = current_mod
-
-            base_dir = os.path.dirname(cmake_file)
-            lines = self.file_cache[cmake_file]
             modified = False
-            i = 0
-            new_lines = []
-            total_lines = len(lines)
-            while i < total_lines:
-                line = lines[i]
-                if self.SPECIAL_MARKER in line:
-                    new_lines.append(line)
-                    i += 1
-                    if i < total_lines:
-                        m = re.search(r'^(\s*)set\s*\(', lines[i], re.IGNORECASE)
-                        if m:
-                            indent = m.group(1)
-                            command_block = lines[i].rstrip("\n")
-                            paren_count = lines[i].count('(') - lines[i].count(')')
-                            i += 1
-                            while paren_count > 0 and i < total_lines:
-                                command_block += "\n" + lines[i].rstrip("\n")
-                                paren_count += lines[i].count('(') - lines[i].count(')')
-                                i += 1
-                            try:
-                                inner = command_block.split("(", 1)[1].rsplit(")", 1)[0].strip()
-                                tokens = shlex.split(inner)
-                                if tokens and tokens[0] == variable:
-                                    # Compute current file tokens (assumed to be relative) and normalize them.
-                                    current_files = [os.path.normpath(token.strip('"')) for token in tokens[1:]]
-                                    updated_files = current_files.copy()
-                                    # Compute relative paths for the event file.
-                                    rel_event = os.path.normpath(os.path.relpath(file_path, base_dir))
-                                    rel_new = os.path.normpath(os.path.relpath(new_file_path, base_dir)) if new_file_path else None
-
-                                    if event_type in ("created", "modified"):
-                                        if rel_event not in current_files:
-                                            updated_files.append(rel_event)
-                                            modified = True
-                                    elif event_type == "deleted":
-                                        if rel_event in current_files:
-                                            updated_files = [f for f in current_files if f != rel_event]
-                                            modified = True
-                                    elif event_type == "moved":
-                                        if rel_event in current_files:
-                                            updated_files = [rel_new if f == rel_event else f for f in current_files]
-                                            modified = True
-                                        else:
-                                            if rel_new not in current_files:
-                                                updated_files.append(str(rel_new))
-                                                modified = True
-
-                                    # Rebuild the set() command with one file per line.
-                                    new_cmd = f"{indent}set({variable}\n" + "\n".join(f'"{f}"' for f in updated_files) + "\n)\n"
-                                    new_lines.append(new_cmd)
-                                else:
-                                    new_lines.append(command_block + "\n")
-                            except Exception:
-                                new_lines.append(command_block + "\n")
-                        else:
-                            continue
-                else:
-                    new_lines.append(line)
-                    i += 1
-            if modified:
-                with open(cmake_file, 'w') as f:
-                    f.writelines(new_lines)
-                self.file_cache[cmake_file] = new_lines
-                print(f"Modified variable '{variable}' in {cmake_file}")
+            for block in self.results[cmake_file]:
+                if block.var_name == variable:
+                    if self._apply_event(cmake_file, block, event_type, file_path, new_file_path):
+                        modified = True
+            if modified and self._write_file(cmake_file):
+                logger.info("Modified variable '%s' in %s", variable, cmake_file)
                 modified_any = True
         return modified_any
 
+    def _manages(self, file_path, watch_filter):
+        """Return True if events on file_path would be routed to observed variables."""
+        if watch_filter is not None and not watch_filter.accepts(file_path):
+            return False
+        return not self.is_excluded(file_path)
+
+    @staticmethod
+    def _list_directory(directory):
+        """Names of the regular files in one directory (None if the directory does not exist)."""
+        names = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            names.add(entry.name)
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return names
+
+    def _load_listing(self):
+        """Return the stored {directory: set of file names}, or None if there is none."""
+        try:
+            with open(self.listing_file) as f:
+                listing = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable listing %s: %s", self.listing_file, e)
+            return None
+        return {directory: set(names) for directory, names in listing.items()}
+
+    def _store_listing(self, names_by_dir):
+        if self.writer.dry_run:
+            return
+        tmp_path = self.listing_file + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({d: sorted(names) for d, names in sorted(names_by_dir.items())}, f, indent=1)
+            os.replace(tmp_path, self.listing_file)
+        except OSError as e:
+            logger.warning("Could not write listing %s: %s", self.listing_file, e)
+
+    def save_listing(self):
+        """Refresh the listing stored by reconcile(), if there is one, e.g. before exiting."""
+        if not os.path.exists(self.listing_file):
+            return
+        names_by_dir = {}
+        for directory in list(self.dir_index):
+            names = self._list_directory(directory)
+            if names is not None:
+                names_by_dir[directory] = names
+        self._store_listing(names_by_dir)
+
+    def reconcile(self, watch_filter=None):
+        """
+        Bring every observed variable in line with the files that are on disk now, e.g. after
+        files were created, deleted or renamed while the watcher was not running.
+        Each directory referenced by an observed variable is listed once; a variable then loses the
+        listed files that no longer exist and gains the managed files of its directories that
+        appeared since the listing stored by the previous reconcile() or save_listing() and that no
+        observed variable lists yet. Without a stored listing nothing is added; the listing is
+        recorded for the next run. Files rejected by watch_filter or by the variable's own patterns
+        are left alone, as live events would be. Entries containing ${VAR}, $<...> or @VAR@ are
+        never touched, and neither are entries whose directory could not be listed.
+        All corrections are made in memory and each CMake file is written at most once.
+        Returns a dict with the number of scanned directories, added and removed entries and the
+        list of written CMake files.
+        """
+        for cmake_file in list(self.results):
+            self._ensure_fresh(cmake_file)
+        recorded = self._load_listing() or {}
+        names_by_dir = {}
+        listings = {}
+        appeared = set()
+        for directory in list(self.dir_index):
+            names = self._list_directory(directory)
+            if names is None:
+                continue
+            names_by_dir[directory] = names
+            listings[directory] = {path for path in (os.path.join(directory, name) for name in names)
+                                   if self._manages(path, watch_filter)}
+            if directory in recorded:
+                appeared.update(os.path.join(directory, name) for name in names - recorded[directory])
+        added_total = removed_total = 0
+        dirty = {}
+        for cmake_file, blocks in list(self.results.items()):
+            base_dir = os.path.dirname(cmake_file)
+            for block in blocks:
+                # Only literal paths in scanned directories are compared with the disk.
+                paths = {os.path.normpath(os.path.join(base_dir, token)) for token in block.tokens
+                         if not self._EXPRESSION_RE.search(token)}
+                paths = {p for p in paths if os.path.dirname(p) in listings}
+                present = set()
+                for directory in {os.path.dirname(p) for p in paths}:
+                    present |= listings[directory]
+                if block.rules:
+                    present = {p for p in present if block.rules.accepts(os.path.basename(p))}
+                missing = {p for p in paths - present if self._manages(p, watch_filter)
+                           and block.rules.accepts(os.path.basename(p))}
+                # Files listed by any variable belong to it; other files are only taken if new.
+                added = {p for p in present - paths if p in appeared and p not in self.path_index}
+                if not missing and not added:
+                    continue
+                updated_files = [t for t in block.tokens if self._EXPRESSION_RE.search(t)
+                                 or os.path.normpath(os.path.join(base_dir, t)) not in missing]
+                updated_files += sorted(os.path.normpath(os.path.relpath(p, base_dir)) for p in added)
+                self._splice_block(cmake_file, block, updated_files)
+                logger.info("Reconciled '%s' in %s: +%d -%d file(s)", block.var_name, cmake_file, len(added), len(missing))
+                added_total += len(added)
+                removed_total += len(missing)
+                dirty.setdefault(cmake_file, set()).add(block.var_name)
+        for cmake_file in dirty:
+            self._stage_file(cmake_file)
+        written = self._flush_writes()
+        self._store_listing(names_by_dir)
+        METRICS.counter("reconcile_added").inc(added_total)
+        METRICS.counter("reconcile_removed").inc(removed_total)
+        return {"directories": len(listings), "added": added_total, "removed": removed_total, "written": written}
 
     def get_watch_directories(self):
         """Return a list of valid directories to watch.
            Each variable’s value is interpreted as file path(s) relative to the CMake file in which it is defined.
-           The variable may contain multiple file paths enclosed in double quotes.
+           The variable's file paths are the arguments the lexer found in its set() command.
            Since these paths refer to files, their directory names are used.
            The most low-level common directory among all is returned if possible."""
         all_dirs = []
         for file_path, var_list in self.results.items():
             base_dir = os.path.dirname(file_path)
-            for var_name, var_value, _, _, _ in var_list:
-                if not var_value:
-                    continue
-                # Extract file paths from var_value (may be multiple, in double quotes).
-                paths = re.findall(r'"([^"]+)"', var_value)
-                if not paths:
-                    paths = [var_value]
-                for p in paths:
+            for block in var_list:
+                for p in block.tokens:
                     resolved = os.path.join(base_dir, p) if not os.path.isabs(p) else p
                     resolved = os.path.normpath(resolved)
                     # Use the directory name of the file path.
@@ -261,20 +763,47 @@ class CMakeWatcher:
         else:
             return list(set(all_dirs))
 
-    def backup_files(self):
+    def get_watch_schedule(self, mode="common", watch_filter=None):
         """
-        Backup all CMakeLists.txt files found in the parsed tree.
-        The backup folder (.cmake_observer_backup) will be created in the directory of the main CMake file,
-        preserving the folder structure relative to that directory.
+        Return the watches to register as a sorted list of (directory, recursive) pairs.
+          - "common": the directories from get_watch_directories(), watched recursively.
+          - "precise": exactly the existing directories that hold files of observed variables,
+            each watched non-recursively. Events are only routed for these directories anyway.
+        Directories holding parsed CMake files are added non-recursively when not already covered.
+        Directories rejected by watch_filter's directory excludes are left out.
         """
-        backup_root = os.path.join(os.path.dirname(self.main_cmake), ".cmake_observer_backup")
-        for file_path in self.results.keys():
-            # Compute relative path from the main CMake file's directory.
-            rel_path = os.path.relpath(file_path, os.path.dirname(self.main_cmake))
-            backup_path = os.path.join(backup_root, rel_path)
-            backup_dir = os.path.dirname(backup_path)
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
-            shutil.copy2(file_path, backup_path)
-            print(f"Backed up {file_path} to {backup_path}")
+        if mode == "common":
+            dirs = self.get_watch_directories()
+            recursive = True
+        elif mode == "precise":
+            dirs = [d for d in self.dir_index if os.path.isdir(d)]
+            recursive = False
+        else:
+            raise ValueError(f"Unknown watch mode: {mode}")
+        schedule = {d: recursive for d in dirs}
+        # The CMake files themselves are watched so external edits are re-parsed.
+        roots = [d + os.sep for d in dirs] if recursive else []
+        for cmake_file in self.results:
+            cmake_dir = os.path.dirname(cmake_file)
+            if cmake_dir not in schedule and not any((cmake_dir + os.sep).startswith(r) for r in roots):
+                schedule[cmake_dir] = False
+        if watch_filter is not None:
+            schedule = {d: r for d, r in schedule.items() if not watch_filter.excludes_dir(d)}
+        return sorted(schedule.items())
 
+    def backup_files(self, compress=False, keep=None):
+        """
+        Snapshot all parsed CMake files into the backup store in .cmake_observer_backup, next to
+        the main CMake file. Contents are stored once per hash, so only files that changed since
+        an earlier snapshot are copied. Returns the snapshot id, or None if no CMake file was parsed.
+        """
+        if not self.results:
+            logger.warning("No parsed CMake files to back up")
+            return None
+        self.backup_store = BackupStore(self.backup_root, compress=compress, keep=keep)
+        snapshot_id = self.backup_store.snapshot(
+            os.path.dirname(self.main_cmake),
+            {cmake_file: self.content_hashes.get(cmake_file) for cmake_file in self.results}, "startup")
+        logger.info("Backed up %d CMake file(s) to %s as snapshot %s (%d new object(s))",
+                    len(self.results), self.backup_root, snapshot_id, self.backup_store.objects_written)
+        return snapshot_id
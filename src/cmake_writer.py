@@ -0,0 +1,95 @@
+import os
+import stat
+
+class CMakeWriter:
+    """
+    Collects the new content of CMake files and writes each file at most once per flush.
+    Every write goes to a temporary file in the same directory that then replaces the target
+    with os.replace, so readers (e.g. a concurrent CMake configure) never see a truncated file.
+    Content that is byte-identical to what is on disk is not written at all. A symlinked file is
+    written through the link: its target is replaced and the link is left in place.
+
+    fsync modes: "none" leaves flushing to the OS, "file" fsyncs the temporary file before
+    the rename, "dir" additionally fsyncs the directory so the rename itself is durable.
+    With dry_run set nothing is written; writes are only counted.
+    """
+    FSYNC_MODES = ("none", "file", "dir")
+    TEMP_SUFFIX = ".cmake_watcher.tmp"
+
+    def __init__(self, fsync="none", dry_run=False):
+        if fsync not in self.FSYNC_MODES:
+            raise ValueError(f"Unknown fsync mode: {fsync}")
+        self.fsync = fsync
+        self.dry_run = dry_run
+        self.pending = {}
+        self.files_written = 0
+        self.writes_skipped = 0
+        self.bytes_written = 0
+
+    @classmethod
+    def is_temp_file(cls, file_path):
+        return file_path.endswith(cls.TEMP_SUFFIX)
+
+    def stage(self, file_path, data):
+        """Queue the new content (bytes) of file_path; a later stage of the same file replaces it."""
+        self.pending[file_path] = data
+
+    def flush(self):
+        """Write all staged files. Returns {path: (written, os.stat_result)}."""
+        pending, self.pending = self.pending, {}
+        results = {}
+        for file_path, data in pending.items():
+            written = self.write(file_path, data)
+            results[file_path] = (written, os.stat(file_path))
+        return results
+
+    def write(self, file_path, data):
+        """Atomically replace file_path with data unless it already holds exactly that. Returns True if written."""
+        try:
+            current = os.stat(file_path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and current.st_size == len(data):
+            with open(file_path, 'rb') as f:
+                if f.read() == data:
+                    self.writes_skipped += 1
+                    return False
+        if self.dry_run:
+            self.files_written += 1
+            self.bytes_written += len(data)
+            return True
+        directory, name = os.path.split(os.path.realpath(file_path))
+        tmp_path = os.path.join(directory, "." + name + self.TEMP_SUFFIX)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if self.fsync != "none":
+                    f.flush()
+                    os.fsync(f.fileno())
+            if current is not None:
+                os.chmod(tmp_path, stat.S_IMODE(current.st_mode))
+            os.replace(tmp_path, os.path.join(directory, name))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        if self.fsync == "dir":
+            self._fsync_dir(directory)
+        self.files_written += 1
+        self.bytes_written += len(data)
+        return True
+
+    @staticmethod
+    def _fsync_dir(directory):
+        try:
+            fd = os.open(directory or ".", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
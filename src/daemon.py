@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from watchdog.events import FileSystemEventHandler
+from src.cmake_watcher import CMakeWatcher
+from src.file_event_handler import FileEventHandler
+from src.watch_scheduler import WatchScheduler
+
+logger = logging.getLogger(__name__)
+
+class Project:
+    __slots__ = ("name", "watcher", "handler", "schedule")
+
+    def __init__(self, name, watcher, handler):
+        self.name = name
+        self.watcher = watcher
+        self.handler = handler
+        self.schedule = []
+
+
+class WatcherDaemon:
+    """
+    Hosts several CMake projects in one process on one shared watchdog observer.
+
+    The watches of all projects are merged into one deduplicated schedule (a directory below a
+    recursive watch is not watched again), and a single routing table maps every watched
+    directory to the projects that want it:
+      exact[dir]     -> projects watching dir non-recursively,
+      recursive[dir] -> projects watching dir and everything below it.
+    An event is routed by looking up the directory of its path and then each ancestor in
+    `recursive`, and handed only to the FileEventHandler of the projects found there.
+    """
+
+    def __init__(self, observer, watch_mode="common", watch_filter=None, debounce=0.25,
+                 parse_workers=None, fsync="none", cache=False, backup_keep=None, backup_compress=False):
+        self.observer = observer
+        self.watch_mode = watch_mode
+        self.watch_filter = watch_filter
+        self.debounce = debounce
+        self.parse_workers = parse_workers
+        self.fsync = fsync
+        self.cache = cache
+        self.backup_keep = backup_keep
+        self.backup_compress = backup_compress
+        self.projects = {}
+        self.exact = {}
+        self.recursive = {}
+        self.routed_events = 0
+        self.unrouted_events = 0
+        # Files the daemon writes itself (control socket, ...), excluded from every project.
+        self.excluded_paths = []
+        self._lock = threading.RLock()
+        self.scheduler = WatchScheduler(observer, _RoutingHandler(self))
+
+    def add_project(self, cmake_file, name=None):
+        cmake_file = os.path.abspath(cmake_file)
+        name = name or cmake_file
+        with self._lock:
+            if name in self.projects:
+                raise ValueError(f"Project {name} already exists")
+        if not os.path.isfile(cmake_file):
+            raise ValueError(f"{cmake_file} is not a file")
+        cache_file = os.path.join(os.path.dirname(cmake_file), ".cmake_watcher_cache") if self.cache else None
+        watcher = CMakeWatcher(cmake_file, cache_file=cache_file, fsync=self.fsync)
+        for path in self.excluded_paths:
+            watcher.exclude_path(path)
+        watcher.parse(workers=self.parse_workers)
+        if not watcher.results:
+            raise ValueError(f"Could not parse {cmake_file}")
+        watcher.backup_files(compress=self.backup_compress, keep=self.backup_keep)
+        project = Project(name, watcher, None)
+        # Patterns are matched below each project's own directory.
+        watch_filter = self.watch_filter.for_root(os.path.dirname(cmake_file)) if self.watch_filter else None
+        project.handler = FileEventHandler(watcher, debounce=self.debounce, watch_filter=watch_filter,
+                                           on_schedule_change=lambda: self._refresh(project))
+        with self._lock:
+            if name in self.projects:
+                raise ValueError(f"Project {name} already exists")
+            self.projects[name] = project
+            self._refresh(project)
+        logger.info("Added project %s: %d CMake file(s), %d watched director(ies)",
+                    name, len(watcher.results), len(project.schedule))
+        return project
+
+    def exclude_path(self, file_path):
+        """Never route events on file_path to any project, present or future."""
+        with self._lock:
+            self.excluded_paths.append(file_path)
+            for project in self.projects.values():
+                project.watcher.exclude_path(file_path)
+
+    def remove_project(self, name):
+        with self._lock:
+            project = self.projects.pop(name)
+            self._sync()
+        project.handler.flush()
+        project.watcher.save_cache()
+        project.watcher.save_listing()
+        logger.info("Removed project %s", name)
+        return project
+
+    def _refresh(self, project):
+        """Recompute the schedule of one project and apply the merged schedule to the observer."""
+        with self._lock:
+            schedule = project.watcher.get_watch_schedule(self.watch_mode, project.handler.watch_filter)
+            if not schedule:
+                schedule = [(os.path.dirname(project.watcher.main_cmake), True)]
+            project.schedule = schedule
+            project.watcher.schedule_dirty = False
+            if project.name in self.projects:
+                self._sync()
+
+    def _sync(self):
+        exact, recursive = {}, {}
+        for project in self.projects.values():
+            for directory, is_recursive in project.schedule:
+                (recursive if is_recursive else exact).setdefault(directory, set()).add(project.name)
+        # Swap in whole tables so the observer thread always routes against a consistent pair.
+        self.exact, self.recursive = exact, recursive
+        added, removed = self.scheduler.sync(self.merged_schedule())
+        if added or removed:
+            logger.info("Watch schedule updated: +%d -%d director(ies), %s in use",
+                        len(added), len(removed), self.scheduler.describe())
+
+    def merged_schedule(self):
+        """The schedule of all projects with directories already covered by a recursive watch removed."""
+        wanted = {d: False for d in self.exact}
+        wanted.update({d: True for d in self.recursive})
+        roots = sorted(d for d, is_recursive in wanted.items() if is_recursive)
+        merged = []
+        for directory, is_recursive in sorted(wanted.items()):
+            if any(directory != root and (directory + os.sep).startswith(root + os.sep) for root in roots):
+                continue
+            merged.append((directory, is_recursive))
+        return merged
+
+    def owners(self, path):
+        """Names of the projects whose watches cover path."""
+        exact, recursive = self.exact, self.recursive
+        directory = os.path.dirname(path)
+        names = set(exact.get(directory, ()))
+        while True:
+            names.update(recursive.get(directory, ()))
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return names
+            directory = parent
+
+    def dispatch(self, event):
+        names = self.owners(event.src_path)
+        dest_path = getattr(event, "dest_path", None)
+        if dest_path:
+            names |= self.owners(dest_path)
+        if not names:
+            self.unrouted_events += 1
+            return
+        self.routed_events += 1
+        projects = self.projects
+        for name in names:
+            project = projects.get(name)
+            if project is not None:
+                project.handler.dispatch(event)
+
+    def stats(self):
+        return {
+            "routed_events": self.routed_events,
+            "unrouted_events": self.unrouted_events,
+            "inotify_watches": self.scheduler.watch_count(),
+            "projects": {name: dict(project.handler.stats(), cmake_files=len(project.watcher.results))
+                         for name, project in self.projects.items()},
+        }
+
+    def handle_command(self, request):
+        """Execute one control request (a dict with a 'cmd' key) and return the response dict."""
+        cmd = request.get("cmd")
+        try:
+            if cmd == "add":
+                project = self.add_project(request["cmake_file"], request.get("name"))
+                return {"ok": True, "name": project.name}
+            if cmd == "remove":
+                self.remove_project(request["name"])
+                return {"ok": True}
+            if cmd == "list":
+                return {"ok": True, "projects": {name: project.watcher.main_cmake
+                                                 for name, project in self.projects.items()}}
+            if cmd == "stats":
+                return {"ok": True, "stats": self.stats()}
+        except KeyError as e:
+            return {"ok": False, "error": f"unknown or missing {e}"}
+        except (ValueError, OSError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": False, "error": f"unknown command {cmd!r}"}
+
+    def serve_control(self, socket_path):
+        """Accept JSON-line requests on a Unix socket in a background thread. Returns the server."""
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.exclude_path(socket_path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        response = {"ok": False, "error": "malformed request"}
+                    else:
+                        response = daemon.handle_command(request)
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="daemon-control", daemon=True).start()
+        return server
+
+    def shutdown(self):
+        for project in list(self.projects.values()):
+            project.handler.flush()
+            project.watcher.save_cache()
+            project.watcher.save_listing()
+
+
+def send_command(socket_path, request):
+    """Send one request to a running daemon and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        return json.loads(sock.makefile().readline())
+
+
+class _RoutingHandler(FileSystemEventHandler):
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def dispatch(self, event):
+        if event.is_directory or event.event_type not in ("created", "modified", "deleted", "moved"):
+            return
+        self.daemon.dispatch(event)
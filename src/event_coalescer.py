@@ -0,0 +1,60 @@
+class EventCoalescer:
+    """
+    Folds a burst of file events into the net change per path.
+    Every path seen in the burst is tracked by the path it had before the burst started
+    (its origin), so create->delete cancels out, rename chains collapse into a single move
+    and a temp-file swap collapses into a single modification.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Current path -> origin path, or None if the file did not exist before the burst.
+        self._pending = {}
+        # Origin paths that no longer exist.
+        self._removed = set()
+        self.raw_events = 0
+
+    def __len__(self):
+        return len(self._pending) + len(self._removed)
+
+    def add(self, event_type, file_path, new_path=None):
+        self.raw_events += 1
+        if event_type == "created":
+            if file_path in self._removed:
+                # Deleted and created again: the original file is simply modified.
+                self._removed.discard(file_path)
+                self._pending[file_path] = file_path
+            else:
+                self._pending.setdefault(file_path, None)
+        elif event_type == "modified":
+            self._pending.setdefault(file_path, file_path)
+        elif event_type == "deleted":
+            origin = self._pending.pop(file_path, file_path)
+            if origin is not None:
+                self._removed.add(origin)
+        elif event_type == "moved":
+            origin = self._pending.pop(file_path, file_path)
+            overwritten = self._pending.pop(new_path, None)
+            if overwritten is not None and overwritten != new_path:
+                self._removed.add(overwritten)
+            if new_path in self._removed:
+                self._removed.discard(new_path)
+                if origin is None:
+                    # A new file moved over one that existed before: net modification.
+                    origin = new_path
+            self._pending[new_path] = origin
+
+    def drain(self):
+        """Return the net changes as (event_type, path, new_path) tuples and reset the state."""
+        changes = [("deleted", path, None) for path in sorted(self._removed)]
+        for path, origin in self._pending.items():
+            if origin is None:
+                changes.append(("created", path, None))
+            elif origin == path:
+                changes.append(("modified", path, None))
+            else:
+                changes.append(("moved", origin, path))
+        self.clear()
+        return changes
@@ -0,0 +1,107 @@
+import difflib
+import logging
+import os
+import struct
+import threading
+import time
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("created", "deleted", "modified", "moved")
+_EVENT_CLASSES = {"created": FileCreatedEvent, "deleted": FileDeletedEvent, "modified": FileModifiedEvent}
+
+
+class EventRecorder:
+    """
+    Append-only log of the raw file events a FileEventHandler receives.
+
+    File format: MAGIC and one version byte, then one record per event:
+    struct "<dBHH" (wall-clock timestamp, event type index, src length, dest length) followed by
+    the src and dest paths as file system bytes (dest is empty unless the event is a move).
+    Appending to an existing log continues it. Every record is flushed as it is written, so a
+    killed process leaves at most a torn last record, which read_events() skips.
+    """
+    MAGIC = b"CMWEVLOG"
+    VERSION = 1
+    RECORD = struct.Struct("<dBHH")
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.events = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(self.MAGIC + bytes([self.VERSION]))
+            self._file.flush()
+
+    def record(self, event_type, src_path, dest_path=None):
+        src = os.fsencode(src_path)
+        dest = os.fsencode(dest_path) if dest_path else b""
+        data = self.RECORD.pack(time.time(), EVENT_TYPES.index(event_type), len(src), len(dest)) + src + dest
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            self.events += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_events(path):
+    """Yield (timestamp, event_type, src_path, dest_path or None) from an event log."""
+    header = len(EventRecorder.MAGIC) + 1
+    record = EventRecorder.RECORD
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(EventRecorder.MAGIC)] != EventRecorder.MAGIC or data[header - 1:header] != bytes([EventRecorder.VERSION]):
+        raise ValueError(f"{path} is not an event log of this version")
+    offset = header
+    while offset + record.size <= len(data):
+        timestamp, type_index, src_len, dest_len = record.unpack_from(data, offset)
+        offset += record.size
+        if offset + src_len + dest_len > len(data):
+            logger.warning("Ignoring truncated last record in %s", path)
+            return
+        src = os.fsdecode(data[offset:offset + src_len])
+        offset += src_len
+        dest = os.fsdecode(data[offset:offset + dest_len]) if dest_len else None
+        offset += dest_len
+        yield timestamp, EVENT_TYPES[type_index], src, dest
+
+
+def replay(path, event_handler, paced=False):
+    """
+    Feed the events of a log through event_handler as if the observer had delivered them, either
+    as fast as possible or with the gaps between the recorded timestamps, then flush the pending
+    batch. Returns (number of events, seconds taken).
+    """
+    started = time.perf_counter()
+    count = 0
+    previous = None
+    for timestamp, event_type, src, dest in read_events(path):
+        if paced and previous is not None and timestamp > previous:
+            time.sleep(timestamp - previous)
+        previous = timestamp
+        if event_type == "moved":
+            event = FileMovedEvent(src, dest)
+        else:
+            event = _EVENT_CLASSES[event_type](src)
+        event_handler.dispatch(event)
+        count += 1
+    event_handler.flush()
+    return count, time.perf_counter() - started
+
+
+def unified_diffs(cmake_watcher):
+    """Yield (cmake_file, unified diff) for every CMake file whose updated content differs from the file on disk."""
+    for cmake_file in sorted(cmake_watcher.file_cache):
+        new_lines = cmake_watcher.file_cache[cmake_file]
+        try:
+            with open(cmake_file, 'rb') as f:
+                old_lines = f.read().decode('utf-8').splitlines(True)
+        except OSError:
+            old_lines = []
+        if old_lines != new_lines:
+            yield cmake_file, "".join(difflib.unified_diff(old_lines, new_lines, cmake_file, cmake_file + " (replayed)"))
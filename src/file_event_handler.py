@@ -1,9 +1,44 @@
+import logging
 import os
+import threading
+import time
 from watchdog.events import FileSystemEventHandler
+from src.event_coalescer import EventCoalescer
+from src.metrics import METRICS, PROFILER
+
+logger = logging.getLogger(__name__)
 
 class FileEventHandler(FileSystemEventHandler):
-    def __init__(self, cmake_watcher):
+    def __init__(self, cmake_watcher, debounce=0.0, max_delay=None, watch_filter=None, on_schedule_change=None):
+        """
+        watch_filter optionally drops events on paths rejected by a WatchFilter.
+        on_schedule_change is called after an update changed the directories that need watching
+        (e.g. an external CMake edit attached a subdirectory).
+        debounce is the quiet window in seconds. With a window of 0 every event is applied as it
+        arrives; otherwise events are coalesced until no new event has arrived for `debounce`
+        seconds (or `max_delay` seconds have passed since the first one) and applied as one batch.
+        """
         self.cmake_watcher = cmake_watcher
+        self.watch_filter = watch_filter
+        self.on_schedule_change = on_schedule_change
+        self.debounce = debounce
+        self.max_delay = max_delay if max_delay is not None else debounce * 10
+        self.coalescer = EventCoalescer()
+        self._lock = threading.Lock()
+        # Serializes batches so the watcher is only ever updated from one thread at a time.
+        self._apply_lock = threading.Lock()
+        self._timer = None
+        self._first_pending = None
+        # Counters: raw events received, net changes applied, raw events folded away by coalescing,
+        # echoes of the watcher's own writes and events on excluded paths (CMake files, backups).
+        self.raw_events = 0
+        self.applied_events = 0
+        self.collapsed_events = 0
+        self.echo_events = 0
+        self.ignored_events = 0
+        self.reloads = 0
+        # Optional EventRecorder that logs every raw event before anything is dropped.
+        self.recorder = None
 
     def on_created(self, event):
         if event.is_directory:
@@ -25,14 +60,140 @@ class FileEventHandler(FileSystemEventHandler):
             return
         self.handle_event(event, event_type="moved", new_path=event.dest_path)
 
+    def to_change(self, event_type, src_path, new_path=None):
+        """
+        Count a raw event and translate it into an (event_type, file_path, new_path) change,
+        or return None if it is dropped (echo of our own write, filtered or excluded path).
+        """
+        self.raw_events += 1
+        METRICS.counter("events_received").inc()
+        if self.recorder is not None:
+            # Writing the log fires events on it; recording those would feed back forever.
+            if os.path.abspath(src_path) == self.recorder.path:
+                self.ignored_events += 1
+                METRICS.counter("events_ignored").inc()
+                return None
+            self.recorder.record(event_type, src_path, str(new_path) if event_type == "moved" else None)
+        # Cheapest check first: names no observed variable takes are dropped before any path work.
+        if self.cmake_watcher.rejects_event(src_path, str(new_path) if event_type == "moved" else None):
+            self.ignored_events += 1
+            METRICS.counter("events_ignored").inc()
+            return None
+        file_path = os.path.abspath(src_path)
+        new_value = os.path.abspath(str(new_path)) if event_type == "moved" else None
+        if self._should_drop(file_path, new_value):
+            return None
+        if new_value is not None and self.watch_filter:
+            # A move across the filter boundary is a plain deletion or creation of the accepted side.
+            if not self.watch_filter.accepts(new_value):
+                event_type, new_value = "deleted", None
+            elif not self.watch_filter.accepts(file_path):
+                event_type, file_path, new_value = "created", new_value, None
+        return event_type, file_path, new_value
+
     def handle_event(self, event, event_type, new_path=None):
-        file_path = os.path.abspath(event.src_path)
-        if event_type == "moved":
-            new_value = os.path.abspath(str(new_path))
-            print(f"File event: moved for '{file_path}'. Updating variable with new value '{new_value}'")
-            self.cmake_watcher.update_variable_by_file_event(event_type, file_path, new_value)
-        else:
-            print(f"File event: {event_type} for '{file_path}'. Updating variable.")
-            self.cmake_watcher.update_variable_by_file_event(event_type, file_path)
+        change = self.to_change(event_type, event.src_path, new_path)
+        if change is None:
+            return
+        event_type, file_path, new_value = change
+        if self.debounce <= 0:
+            self.applied_events += 1
+            METRICS.counter("events_applied").inc()
+            with self._apply_lock:
+                if event_type == "moved":
+                    logger.debug("File event: moved for '%s'. Updating variable with new value '%s'", file_path, new_value)
+                else:
+                    logger.debug("File event: %s for '%s'. Updating variable.", event_type, file_path)
+                self._apply([(event_type, file_path, new_value)])
+            return
+        with self._lock:
+            self.coalescer.add(event_type, file_path, new_value)
+            now = time.monotonic()
+            if self._first_pending is None:
+                self._first_pending = now
+            if self._timer is not None:
+                self._timer.cancel()
+            # Restart the quiet window, but never postpone a batch beyond max_delay.
+            delay = min(self.debounce, max(0.0, self._first_pending + self.max_delay - now))
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _should_drop(self, file_path, new_value):
+        watcher = self.cmake_watcher
+        # Atomic rewrites arrive as a rename of the temporary file onto the CMake file.
+        if watcher.is_own_write(new_value or file_path):
+            self.echo_events += 1
+            METRICS.counter("events_echo").inc()
+            return True
+        # Edits of the CMake files themselves are re-parsed, never routed to variables.
+        if watcher.is_cmake_file(new_value or file_path):
+            return False
+        if self.watch_filter and not self.watch_filter.accepts(file_path) and (
+                new_value is None or not self.watch_filter.accepts(new_value)):
+            self.ignored_events += 1
+            METRICS.counter("events_ignored").inc()
+            return True
+        if watcher.is_excluded(file_path) and (new_value is None or watcher.is_excluded(new_value)):
+            self.ignored_events += 1
+            METRICS.counter("events_ignored").inc()
+            return True
+        return False
+
+    def flush(self):
+        """Apply all pending coalesced events as one batch. Returns the number of net changes applied."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._first_pending = None
+            raw = self.coalescer.raw_events
+            changes = self.coalescer.drain()
+        if not raw:
+            return 0
+        return self.apply_batch(changes, raw)
+
+    def apply_batch(self, changes, raw):
+        """Apply the net changes coalesced from `raw` events. Returns the number of changes applied."""
+        self.applied_events += len(changes)
+        self.collapsed_events += raw - len(changes)
+        METRICS.counter("events_applied").inc(len(changes))
+        METRICS.counter("events_coalesced").inc(raw - len(changes))
+        with self._apply_lock:
+            logger.info("Applying %d change(s) from %d file event(s)", len(changes), raw)
+            self._apply(changes)
+        return len(changes)
+
+    def _apply(self, changes):
+        """Re-parse edited CMake files first, then apply the remaining changes as one batch."""
+        with METRICS.histogram("apply_seconds").time(), PROFILER.section():
+            self._apply_changes(changes)
 
+    def _apply_changes(self, changes):
+        watcher = self.cmake_watcher
+        updates = []
+        for change in changes:
+            event_type, file_path, new_path = change
+            target = new_path or file_path
+            if watcher.is_cmake_file(target):
+                if event_type != "deleted":
+                    self.reloads += 1
+                    watcher.reload_cmake_file(target)
+            else:
+                updates.append(change)
+        if updates:
+            watcher.apply_events(updates)
+        if watcher.schedule_dirty:
+            watcher.schedule_dirty = False
+            if self.on_schedule_change is not None:
+                self.on_schedule_change()
 
+    def stats(self):
+        return {
+            "raw_events": self.raw_events,
+            "applied_events": self.applied_events,
+            "collapsed_events": self.collapsed_events,
+            "echo_events": self.echo_events,
+            "ignored_events": self.ignored_events,
+            "reloads": self.reloads,
+        }
@@ -0,0 +1,299 @@
+import bisect
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, Prometheus style."""
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+    __slots__ = ("counts", "count", "total", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+            self.count += 1
+            self.total += value
+
+    @contextlib.contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf if it is above the last bucket)."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for bound, n in zip(self.BUCKETS + (float("inf"),), self.counts):
+                seen += n
+                if seen >= rank:
+                    return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Registry of the watcher's counters, histograms and gauges.
+    Exposed as a dict snapshot, JSON, Prometheus text or a one-line summary.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name):
+        with self._lock:
+            return self.counters.setdefault(name, Counter())
+
+    def histogram(self, name):
+        with self._lock:
+            return self.histograms.setdefault(name, Histogram())
+
+    def gauge(self, name, read):
+        """Register a callable returning the current value of a gauge (e.g. a queue depth)."""
+        with self._lock:
+            self.gauges[name] = read
+
+    def snapshot(self):
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        return {
+            "counters": {name: c.value for name, c in self.counters.items()},
+            "histograms": {
+                name: {"count": h.count, "sum": h.total, "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                for name, h in self.histograms.items()
+            },
+            "gauges": gauges,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def to_prometheus(self):
+        lines = []
+        for name, c in sorted(self.counters.items()):
+            lines.append(f"# TYPE cmake_watcher_{name} counter")
+            lines.append(f"cmake_watcher_{name} {c.value}")
+        for name, read in sorted(self.gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines.append(f"# TYPE cmake_watcher_{name} gauge")
+            lines.append(f"cmake_watcher_{name} {value}")
+        for name, h in sorted(self.histograms.items()):
+            metric = f"cmake_watcher_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(h.BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+            lines.append(f"{metric}_sum {h.total}")
+            lines.append(f"{metric}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def stats_line(self):
+        snap = self.snapshot()
+        parts = [f"{name}={value}" for name, value in sorted(snap["counters"].items())]
+        parts += [f"{name}={value}" for name, value in sorted(snap["gauges"].items())]
+        for name, h in sorted(snap["histograms"].items()):
+            if h["count"]:
+                parts.append(f"{name}_p50<={h['p50'] * 1000:g}ms {name}_p99<={h['p99'] * 1000:g}ms")
+        return " ".join(parts)
+
+    def dump(self, path):
+        """Write the metrics to path: Prometheus text for *.prom files, JSON otherwise."""
+        data = self.to_prometheus() if path.endswith(".prom") else self.to_json() + "\n"
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# Process-wide registry used by the watcher, the handler and the pipelines.
+METRICS = Metrics()
+
+
+class Profiler:
+    """Opt-in cProfile hook: hot paths wrap themselves in `with PROFILER.section():`."""
+
+    def __init__(self):
+        self.profile = None
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    def enable(self):
+        self.profile = cProfile.Profile()
+
+    @contextlib.contextmanager
+    def section(self):
+        profile = self.profile
+        if profile is None:
+            yield
+            return
+        # cProfile cannot profile two threads at once; hot sections are serialized while profiling.
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                profile.enable()
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    profile.disable()
+
+    def dump(self, path):
+        if self.profile is None:
+            return
+        with self._lock:
+            self.profile.dump_stats(path)
+            return pstats.Stats(path)
+
+
+PROFILER = Profiler()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `rate` records per second through (DEBUG and INFO only; warnings and errors
+    always pass) and reports how many were suppressed once output resumes, so console
+    output cannot throttle event handling during storms.
+    """
+
+    def __init__(self, rate=20.0, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+            if self.suppressed:
+                record.msg = f"{record.msg} ({self.suppressed} log message(s) suppressed)"
+                self.suppressed = 0
+        return True
+
+
+class MetricsReporter:
+    """
+    Background thread that logs a stats line and/or dumps the metrics to a file every
+    `interval` seconds, and an optional HTTP endpoint on localhost serving
+    /metrics (Prometheus text) and /metrics.json.
+    """
+
+    def __init__(self, metrics=METRICS, interval=10.0, log_stats=True, dump_path=None, port=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.log_stats = log_stats
+        self.dump_path = dump_path
+        self.port = port
+        self.server = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.log_stats or self.dump_path:
+            self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+            self._thread.start()
+        if self.port is not None:
+            self.server = self._serve(self.port)
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def report(self):
+        if self.log_stats:
+            logging.getLogger(__name__).info("stats: %s", self.metrics.stats_line())
+        if self.dump_path:
+            try:
+                self.metrics.dump(self.dump_path)
+            except OSError as e:
+                logging.getLogger(__name__).warning("Could not write metrics to %s: %s", self.dump_path, e)
+
+    def _serve(self, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = metrics.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        # Leave a final, complete picture behind.
+        if self.dump_path:
+            self.report()
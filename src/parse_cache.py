@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import zlib
+from src.cmake_block import ObservedBlock
+
+logger = logging.getLogger(__name__)
+
+class ParseCache:
+    """
+    On-disk cache of parsed CMake files, so a restart only re-parses files that changed.
+    Entries are keyed by path and validated against (mtime_ns, size) first and the content
+    hash second, so a touched but unchanged file is not parsed again either.
+
+    File format: MAGIC, one version byte, then zlib-compressed JSON of
+    {path: [mtime_ns, size, sha1_hex, blocks, subdirs]} where each block is
+    [var_name, tokens, start, end, indent, newline, patterns, raw]. A file that is truncated, corrupted or
+    written by another version is ignored as a whole and rebuilt.
+    """
+    MAGIC = b"CMWCACHE"
+    VERSION = 4
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning("Could not read parse cache %s: %s", self.path, e)
+            return False
+        header = len(self.MAGIC) + 1
+        try:
+            if data[:len(self.MAGIC)] != self.MAGIC or data[len(self.MAGIC)] != self.VERSION:
+                raise ValueError("unknown format or version")
+            entries = json.loads(zlib.decompress(data[header:]).decode())
+            if not isinstance(entries, dict):
+                raise ValueError("malformed payload")
+        except Exception as e:
+            logger.warning("Ignoring unreadable parse cache %s: %s", self.path, e)
+            self.dirty = True
+            return False
+        self.entries = entries
+        return True
+
+    def save(self, keep=None):
+        """Write the cache if it changed. Entries for files not in `keep` are dropped."""
+        if keep is not None:
+            keep = set(keep)
+            for path in [p for p in self.entries if p not in keep]:
+                del self.entries[path]
+                self.dirty = True
+        if not self.dirty:
+            return False
+        payload = zlib.compress(json.dumps(self.entries, separators=(',', ':')).encode())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.MAGIC + bytes([self.VERSION]) + payload)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        return True
+
+    def get(self, file_path, st):
+        """Return the cached entry if the file's mtime and size are unchanged."""
+        entry = self.entries.get(file_path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry
+        return None
+
+    def get_by_hash(self, file_path, digest):
+        """Return the cached entry if the content hash is unchanged, even though the file was touched."""
+        entry = self.entries.get(file_path)
+        if entry is not None and entry[2] == digest.hex():
+            return entry
+        return None
+
+    def put(self, file_path, st, digest, blocks, subdirs):
+        self.entries[file_path] = [
+            st.st_mtime_ns, st.st_size, digest.hex(),
+            [[b.var_name, b.tokens, b.start, b.end, b.indent, b.newline, list(b.rules.patterns), b.raw]
+             for b in blocks],
+            list(subdirs),
+        ]
+        self.dirty = True
+
+    @staticmethod
+    def decode(entry):
+        """Return (blocks, subdirs, digest) of an entry, building fresh block objects."""
+        blocks = [ObservedBlock(name, list(tokens), start, end, indent, newline, patterns, dict(raw))
+                  for name, tokens, start, end, indent, newline, patterns, raw in entry[3]]
+        return blocks, list(entry[4]), bytes.fromhex(entry[2])
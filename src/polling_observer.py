@@ -0,0 +1,187 @@
+import logging
+import os
+import threading
+import time
+from array import array
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+class _DirSnapshot:
+    """The regular files of one directory: names plus parallel arrays of inode, size and mtime_ns."""
+    __slots__ = ("names", "inodes", "sizes", "mtimes")
+
+    def __init__(self):
+        self.names = []
+        self.inodes = array('Q')
+        self.sizes = array('Q')
+        self.mtimes = array('q')
+
+    def add(self, name, st):
+        self.names.append(name)
+        self.inodes.append(st.st_ino)
+        self.sizes.append(st.st_size)
+        self.mtimes.append(st.st_mtime_ns)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class PollingObserver:
+    """
+    Drop-in replacement for the watchdog observer for file systems without inotify events
+    (NFS, some container bind mounts). Instead of subscribing to events it keeps a compact
+    stat snapshot of the scheduled directories only and diffs it every poll:
+      - names that appeared or vanished become created/deleted events, unless a vanished and an
+        appeared entry share an inode, which is reported as one moved event (also across
+        directories),
+      - a changed inode, size or mtime_ns becomes a modified event.
+    Events are handed to the scheduled handlers exactly as the observer would, so they go
+    through the same FileEventHandler path. Non-recursive watches cost one directory listing
+    per poll; recursive watches are walked. After a poll without changes the interval grows
+    by `backoff` up to `max_interval`, and falls back to `interval` as soon as something changes.
+    """
+
+    def __init__(self, interval=1.0, max_interval=10.0, backoff=1.5):
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.backoff = backoff
+        self.current_interval = interval
+        self.polls = 0
+        self.events = 0
+        # key -> (handler, directory, recursive)
+        self._watches = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def schedule(self, event_handler, path, recursive=False):
+        path = os.path.abspath(path)
+        key = (path, recursive, id(event_handler))
+        with self._lock:
+            self._watches[key] = (event_handler, path, recursive)
+            for directory in self._scan_dirs(path, recursive):
+                if directory not in self._snapshots:
+                    snapshot = self._take(directory)
+                    if snapshot is not None:
+                        self._snapshots[directory] = snapshot
+        return key
+
+    def unschedule(self, watch):
+        with self._lock:
+            self._watches.pop(watch, None)
+            wanted = self._wanted_dirs()
+            for directory in [d for d in self._snapshots if d not in wanted]:
+                del self._snapshots[directory]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="polling-observer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def tracked_entries(self):
+        return sum(len(snapshot) for snapshot in list(self._snapshots.values()))
+
+    def _run(self):
+        while not self._stop.wait(self.current_interval):
+            try:
+                changed = self.poll()
+            except Exception as e:
+                logger.error("Polling failed: %s", e)
+                changed = 0
+            if changed:
+                self.current_interval = self.interval
+            else:
+                self.current_interval = min(self.max_interval, self.current_interval * self.backoff)
+
+    @staticmethod
+    def _scan_dirs(path, recursive):
+        if not recursive:
+            return [path]
+        return [directory for directory, _, _ in os.walk(path)]
+
+    def _wanted_dirs(self):
+        wanted = set()
+        for _, path, recursive in self._watches.values():
+            wanted.update(self._scan_dirs(path, recursive))
+        return wanted
+
+    @staticmethod
+    def _take(directory):
+        snapshot = _DirSnapshot()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            snapshot.add(entry.name, entry.stat())
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return snapshot
+
+    def _handlers_for(self, directory):
+        handlers = []
+        for handler, path, recursive in self._watches.values():
+            if directory == path or (recursive and directory.startswith(path + os.sep)):
+                if handler not in handlers:
+                    handlers.append(handler)
+        return handlers
+
+    def poll(self):
+        """Diff the scheduled directories against their last snapshot and dispatch the events. Returns the event count."""
+        started = time.perf_counter()
+        with self._lock:
+            wanted = self._wanted_dirs()
+            created, deleted, events = {}, {}, []
+            for directory in wanted:
+                old = self._snapshots.get(directory)
+                new = self._take(directory)
+                if new is None:
+                    self._snapshots.pop(directory, None)
+                    new = _DirSnapshot()
+                else:
+                    self._snapshots[directory] = new
+                if old is None:
+                    old = _DirSnapshot()
+                old_index = dict(zip(old.names, range(len(old.names))))
+                for i, name in enumerate(new.names):
+                    j = old_index.pop(name, None)
+                    path = os.path.join(directory, name)
+                    if j is None:
+                        created[new.inodes[i]] = path
+                    elif (old.inodes[j], old.sizes[j], old.mtimes[j]) != (new.inodes[i], new.sizes[i], new.mtimes[i]):
+                        events.append(FileModifiedEvent(path))
+                for name, j in old_index.items():
+                    deleted[old.inodes[j]] = os.path.join(directory, name)
+            # An inode that vanished in one place and appeared in another was renamed.
+            for inode in [inode for inode in deleted if inode in created]:
+                events.append(FileMovedEvent(deleted.pop(inode), created.pop(inode)))
+            events.extend(FileDeletedEvent(path) for path in sorted(deleted.values()))
+            events.extend(FileCreatedEvent(path) for path in sorted(created.values()))
+            dispatch = []
+            for event in events:
+                handlers = self._handlers_for(os.path.dirname(event.src_path))
+                if event.event_type == "moved":
+                    handlers += [h for h in self._handlers_for(os.path.dirname(event.dest_path)) if h not in handlers]
+                dispatch.append((event, handlers))
+        self.polls += 1
+        self.events += len(events)
+        METRICS.histogram("poll_seconds").observe(time.perf_counter() - started)
+        # Handlers may reschedule (and so take the lock), so they run after it is released.
+        for event, handlers in dispatch:
+            for handler in handlers:
+                handler.dispatch(event)
+        return len(events)
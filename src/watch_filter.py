@@ -0,0 +1,120 @@
+import fnmatch
+import os
+import re
+
+class WatchFilter:
+    """
+    Include/exclude glob filters for watched paths.
+    A pattern ending in '/' (e.g. 'build/', '.git/') matches a directory name anywhere in the path,
+    a pattern containing '/' (e.g. 'third_party/*') is matched against the trailing components of
+    the path, or against the whole path if it is absolute, and any other pattern (e.g. '*.o') is
+    matched against the file name. With a root (the project directory) set, directory and
+    relative path patterns only look at the part of the path below the root, so the directories
+    the project itself lives in never match. Excludes win over includes; with no include
+    patterns every path that is not excluded is accepted.
+    """
+
+    def __init__(self, include=None, exclude=None, root=None):
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.root = os.path.abspath(root) if root else None
+        self._root_prefix = os.path.join(self.root, "") if self.root else None
+        self._include = self._compile(self.include)
+        self._exclude = self._compile(self.exclude)
+        self._include_dirs = self._compile_dirs(self.include)
+        self._exclude_dirs = self._compile_dirs(self.exclude)
+
+    def for_root(self, root):
+        """The same patterns, matched below another root."""
+        return WatchFilter(self.include, self.exclude, root)
+
+    @staticmethod
+    def _compile(patterns):
+        names = [fnmatch.translate(p) for p in patterns if not p.endswith('/') and '/' not in p]
+        # Relative path patterns may start at any path component.
+        paths = ["(?:.*/)?" + fnmatch.translate(p)
+                 for p in patterns if not p.endswith('/') and '/' in p and not p.startswith('/')]
+        absolute = [fnmatch.translate(p) for p in patterns if not p.endswith('/') and p.startswith('/')]
+        return tuple(re.compile("|".join(group)) if group else None for group in (names, paths, absolute))
+
+    @staticmethod
+    def _compile_dirs(patterns):
+        dirs = [fnmatch.translate(p.rstrip('/')) for p in patterns if p.endswith('/')]
+        return re.compile("|".join(dirs)) if dirs else None
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def _relative(self, path):
+        """The part of path below the root (the whole path without a root)."""
+        if self._root_prefix is None:
+            return path
+        if path.startswith(self._root_prefix):
+            return path[len(self._root_prefix):]
+        if path == self.root:
+            return ""
+        return os.path.relpath(path, self.root)
+
+    @staticmethod
+    def _matches_dir(dir_re, directory):
+        return any(dir_re.match(part) for part in directory.split(os.sep) if part and part != os.pardir)
+
+    def excludes_dir(self, directory):
+        """Return True if any component of directory below the root matches a directory exclude pattern."""
+        return self._exclude_dirs is not None and self._matches_dir(self._exclude_dirs, self._relative(directory))
+
+    @staticmethod
+    def _matches(patterns, name, relative, file_path):
+        name_re, path_re, absolute_re = patterns
+        return bool((name_re and name_re.match(name)) or (path_re and path_re.match(relative))
+                    or (absolute_re and absolute_re.match(file_path)))
+
+    def accepts(self, file_path):
+        relative = self._relative(file_path)
+        directory, name = os.path.split(relative)
+        if os.sep != '/':
+            relative, file_path = relative.replace(os.sep, '/'), file_path.replace(os.sep, '/')
+        if self._matches(self._exclude, name, relative, file_path):
+            return False
+        if self._exclude_dirs is not None and self._matches_dir(self._exclude_dirs, directory):
+            return False
+        if self._include == (None, None, None) and self._include_dirs is None:
+            return True
+        return (self._matches(self._include, name, relative, file_path)
+                or bool(self._include_dirs and self._matches_dir(self._include_dirs, directory)))
+
+
+class VariableRules:
+    """
+    File-name patterns given on the observe marker of one variable, e.g.
+    `#!CMAKE_WATCHER_OBSERVE *.h *.hpp !*_test.h`. A variable only takes files whose name
+    matches one of its include patterns (any name when there are none) and none of its
+    '!' exclude patterns. Instances are shared between variables with the same patterns.
+    """
+    _compiled = {}
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        includes = [fnmatch.translate(p) for p in self.patterns if not p.startswith('!')]
+        excludes = [fnmatch.translate(p[1:]) for p in self.patterns if p.startswith('!') and len(p) > 1]
+        # Source of the include alternation, so the watcher can merge the includes of all variables.
+        self.include_source = "|".join(includes) if includes else None
+        self._include = re.compile(self.include_source) if includes else None
+        self._exclude = re.compile("|".join(excludes)) if excludes else None
+
+    @classmethod
+    def get(cls, patterns):
+        patterns = tuple(patterns)
+        rules = cls._compiled.get(patterns)
+        if rules is None:
+            rules = cls._compiled.setdefault(patterns, cls(patterns))
+        return rules
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def accepts(self, name):
+        """Match a file name (not a path)."""
+        if self._exclude is not None and self._exclude.match(name):
+            return False
+        return self._include is None or self._include.match(name) is not None
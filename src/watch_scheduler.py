@@ -0,0 +1,44 @@
+import os
+
+class WatchScheduler:
+    """
+    Keeps the watches registered on a watchdog observer in step with a schedule of
+    (directory, recursive) pairs, scheduling and unscheduling only the difference.
+    """
+
+    def __init__(self, observer, event_handler):
+        self.observer = observer
+        self.event_handler = event_handler
+        # directory -> (ObservedWatch, recursive)
+        self.watches = {}
+
+    def sync(self, schedule):
+        """Apply a new schedule. Returns (added, removed) directory lists."""
+        wanted = dict(schedule)
+        removed = [d for d, (_, recursive) in self.watches.items() if wanted.get(d) != recursive]
+        for directory in removed:
+            watch = self.watches.pop(directory)[0]
+            self.observer.unschedule(watch)
+        added = []
+        for directory, recursive in wanted.items():
+            if directory in self.watches or not os.path.isdir(directory):
+                continue
+            watch = self.observer.schedule(self.event_handler, directory, recursive=recursive)
+            self.watches[directory] = (watch, recursive)
+            added.append(directory)
+        return added, removed
+
+    def watch_count(self):
+        """
+        Number of inotify watches in use, or None while a recursive root is scheduled: it costs one
+        watch per directory below it, and counting those would mean walking the whole tree.
+        """
+        if any(recursive for _, recursive in self.watches.values()):
+            return None
+        return len(self.watches)
+
+    def describe(self):
+        count = self.watch_count()
+        if count is None:
+            return "an uncounted number of inotify watches (recursive)"
+        return f"{count} inotify watch(es)"
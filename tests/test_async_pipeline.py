@@ -0,0 +1,89 @@
+import unittest
+import asyncio
+import tempfile
+import threading
+import os
+import shutil
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileMovedEvent
+from src.async_pipeline import AsyncPipeline
+from src.cmake_watcher import CMakeWatcher
+from src.file_event_handler import FileEventHandler
+
+class TestAsyncPipeline(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        with open(self.main_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n"src/b.h"\n)\n')
+        self.watcher = CMakeWatcher(self.main_cmake)
+        self.watcher.parse()
+        self.src = os.path.join(self.test_dir, "src")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_pipeline(self, pipeline, events):
+        async def scenario():
+            task = asyncio.create_task(pipeline.run())
+            await asyncio.sleep(0)
+            # Events arrive from a foreign thread, like the observer's.
+            producer = threading.Thread(target=lambda: [pipeline.submit(e) for e in events])
+            producer.start()
+            await asyncio.get_running_loop().run_in_executor(None, producer.join)
+            pipeline.request_stop()
+            await task
+        asyncio.run(scenario())
+
+    def test_shutdown_flushes_pending_batch(self):
+        handler = FileEventHandler(self.watcher, debounce=60)
+        pipeline = AsyncPipeline(handler, max_queue=2)
+        self.run_pipeline(pipeline, [
+            FileCreatedEvent(os.path.join(self.src, "c.h")),
+            FileMovedEvent(os.path.join(self.src, "b.h"), os.path.join(self.src, "x.h")),
+            FileDeletedEvent(os.path.join(self.src, "a.h")),
+        ])
+        with open(self.main_cmake) as f:
+            content = f.read()
+        self.assertEqual(content, '#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/x.h"\n"src/c.h"\n)\n')
+        self.assertEqual(pipeline.dropped_events, 0)
+        self.assertEqual(handler.stats()["raw_events"], 3)
+
+    def test_drop_newest_overflow(self):
+        handler = FileEventHandler(self.watcher, debounce=60)
+        pipeline = AsyncPipeline(handler, max_queue=1, overflow="drop-newest")
+
+        async def scenario():
+            task = asyncio.create_task(pipeline.run())
+            await asyncio.sleep(0)
+            # Offer events directly on the loop before the router gets a chance to drain the queue.
+            for name in ("c.h", "d.h", "e.h"):
+                pipeline._offer(FileCreatedEvent(os.path.join(self.src, name)))
+            pipeline.request_stop()
+            await task
+        asyncio.run(scenario())
+        self.assertEqual(pipeline.dropped_events, 2)
+        with open(self.main_cmake) as f:
+            content = f.read()
+        self.assertIn('"src/c.h"', content)
+        self.assertNotIn('"src/d.h"', content)
+
+    def test_router_survives_failing_event(self):
+        handler = FileEventHandler(self.watcher, debounce=60)
+        to_change = handler.to_change
+
+        def failing_to_change(event_type, file_path, new_value):
+            if file_path.endswith("bad.h"):
+                raise RuntimeError("boom")
+            return to_change(event_type, file_path, new_value)
+        handler.to_change = failing_to_change
+        pipeline = AsyncPipeline(handler, max_queue=1)
+        with self.assertLogs("src.async_pipeline", "ERROR"):
+            self.run_pipeline(pipeline, [FileCreatedEvent(os.path.join(self.src, name))
+                                         for name in ("bad.h", "c.h", "d.h")])
+        with open(self.main_cmake) as f:
+            content = f.read()
+        self.assertIn('"src/c.h"\n"src/d.h"\n', content)
+        self.assertNotIn("bad.h", content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import tempfile
+import os
+import shutil
+from src.backup_store import BackupStore
+from src.cmake_watcher import CMakeWatcher
+
+class TestBackupStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        self.sub_cmake = os.path.join(self.test_dir, "lib", "CMakeLists.txt")
+        os.makedirs(os.path.dirname(self.sub_cmake))
+        with open(self.main_cmake, "w") as f:
+            f.write('add_subdirectory(lib)\n#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n)\n')
+        with open(self.sub_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Lib_Sources\n"src/x.cpp"\n)\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_snapshots_deduplicate_contents(self):
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        first = watcher.backup_files()
+        store = watcher.backup_store
+        self.assertEqual(store.objects_written, 2)
+        manifest = store.load(first)
+        self.assertEqual(sorted(manifest["files"]), ["CMakeLists.txt", os.path.join("lib", "CMakeLists.txt")])
+        # A restart with unchanged files records nothing new.
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        self.assertEqual(watcher.backup_files(), first)
+        self.assertEqual(watcher.backup_store.objects_written, 0)
+        # A rewrite first snapshots the content it replaces; only the changed file is stored.
+        watcher.update_variable("Lib_Sources", "created", os.path.join(self.test_dir, "lib", "src", "y.cpp"))
+        ids = watcher.backup_store.list_ids()
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(watcher.backup_store.load(ids[-1])["reason"], "before-write")
+        self.assertEqual(watcher.backup_store.objects_written, 0)
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        watcher.backup_files()
+        self.assertEqual(watcher.backup_store.objects_written, 1)
+
+    def test_restore_snapshot(self):
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        original = self.read(self.sub_cmake)
+        snapshot_id = watcher.backup_files(compress=True)
+        watcher.update_variable("Lib_Sources", "deleted", os.path.join(self.test_dir, "lib", "src", "x.cpp"))
+        self.assertNotEqual(self.read(self.sub_cmake), original)
+        store = BackupStore(watcher.backup_root)
+        self.assertEqual(store.restore(snapshot_id, self.test_dir), [self.sub_cmake])
+        self.assertEqual(self.read(self.sub_cmake), original)
+        # The latest snapshot was taken right before the rewrite and holds the same content.
+        self.assertEqual(store.restore("latest", self.test_dir), [])
+        with self.assertRaises(KeyError):
+            store.load("missing")
+
+    def test_retention_drops_unreferenced_objects(self):
+        store = BackupStore(os.path.join(self.test_dir, "backup"), keep=2)
+        for n in range(4):
+            with open(self.main_cmake, "w") as f:
+                f.write(f"# version {n}\n")
+            store.snapshot(self.test_dir, {self.main_cmake: None, self.sub_cmake: None}, "manual")
+        manifests = store.snapshots()
+        self.assertEqual(len(manifests), 2)
+        # The unchanged lib/CMakeLists.txt is shared with the expired snapshots and survives.
+        objects = [name for _, _, names in os.walk(store.objects_dir) for name in names]
+        self.assertEqual(len(objects), 3)
+        self.assertEqual(store.get_object(manifests[-1]["files"]["CMakeLists.txt"]), b"# version 3\n")
+        self.assertEqual(self.read(self.sub_cmake).encode(),
+                         store.get_object(manifests[0]["files"][os.path.join("lib", "CMakeLists.txt")]))
+        self.assertEqual(BackupStore(store.root).list_ids(), store.list_ids())
+
+    def test_nothing_to_back_up(self):
+        missing_dir = os.path.join(self.test_dir, "nope")
+        watcher = CMakeWatcher(os.path.join(missing_dir, "CMakeLists.txt"))
+        watcher.parse()
+        self.assertIsNone(watcher.backup_files())
+        self.assertFalse(os.path.exists(missing_dir))
+        store = BackupStore(os.path.join(self.test_dir, "backup"))
+        self.assertIsNone(store.snapshot(self.test_dir, {os.path.join(missing_dir, "x.txt"): None}))
+        self.assertFalse(os.path.exists(store.root))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import json
+import os
+import tempfile
+import shutil
+from benchmarks import bench_lexer
+from benchmarks.bench_watcher import generate_project, main
+from src.cmake_watcher import CMakeWatcher
+
+class TestBenchmarkHarness(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_generated_project_parses(self):
+        main_cmake, source_dirs = generate_project(self.test_dir, depth=2, fanout=2, variables=3, sources=5)
+        watcher = CMakeWatcher(main_cmake)
+        watcher.parse()
+        self.assertEqual(len(watcher.results), 1 + 2 + 4)
+        self.assertEqual(len(source_dirs), 7 * 3)
+        self.assertEqual(sum(len(b.tokens) for blocks in watcher.results.values() for b in blocks), 7 * 3 * 5)
+
+    def test_report_is_json(self):
+        output = os.path.join(self.test_dir, "report.json")
+        main(["--depth", "1", "--fanout", "2", "--variables", "2", "--sources", "5", "--events", "20",
+              "--debounce", "1", "--workdir", self.test_dir, "--output", output])
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual([r["storm"] for r in report["results"]], ["mass-create", "rename-dir", "branch-switch"])
+        for result in report["results"]:
+            self.assertIn("p99", result["latency_ms"])
+            self.assertGreater(result["events_per_second"], 0)
+        self.assertGreater(report["peak_rss_bytes"], 0)
+
+    def test_report_with_backups(self):
+        output = os.path.join(self.test_dir, "backups.json")
+        main(["--depth", "1", "--fanout", "2", "--variables", "2", "--sources", "5", "--events", "10",
+              "--storm", "mass-create", "--backups", "--backup-keep", "3", "--workdir", self.test_dir,
+              "--output", output])
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report["results"][0]["backup_snapshots"], 3)
+
+    def test_lexer_benchmark_agrees_with_legacy_parser(self):
+        output = os.path.join(self.test_dir, "lexer.json")
+        bench_lexer.main(["--blocks", "20", "--sources", "5", "--repeat", "1", "--output", output])
+        with open(output) as f:
+            report = json.load(f)
+        self.assertTrue(report["same_blocks"])
+        self.assertEqual([r["parser"] for r in report["results"]], ["legacy", "lexer"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import tempfile
+import os
+import shutil
+from src.cmake_block import quote
+from src.cmake_lexer import Command, Comment, lex, unescape
+from src.cmake_watcher import CMakeWatcher
+
+class TestCMakeLexer(unittest.TestCase):
+    def commands(self, text):
+        return [(item.name, item.args) for item in lex(text) if isinstance(item, Command)]
+
+    def test_argument_kinds(self):
+        text = ('set(Files "a b.cpp" c.cpp [[d.cpp]] [=[e]]f.cpp]=] "g\\"h.cpp" "${DIR}/i.cpp" '
+                '"line\\\ncontinued" un\\ escaped)\n')
+        self.assertEqual(self.commands(text), [("set", [
+            "Files", "a b.cpp", "c.cpp", "d.cpp", "e]]f.cpp", 'g"h.cpp', "${DIR}/i.cpp",
+            "linecontinued", "un escaped"])])
+
+    def test_comments_and_nested_parens(self):
+        text = ('#!CMAKE_WATCHER_OBSERVE *.h\n'
+                'set(X # a comment with ) and "\n'
+                '  #[[ a bracket comment\n spanning lines ) ]] "a.h"\n'
+                '  (nested "b.h") )\n'
+                '#[==[ if(not_a_command) ]==]\n'
+                'add_subdirectory ( lib)\n')
+        items = lex(text)
+        self.assertIsInstance(items[0], Comment)
+        self.assertEqual(items[0].text, "#!CMAKE_WATCHER_OBSERVE *.h")
+        self.assertEqual(self.commands(text), [
+            ("set", ["X", "a.h", "(", "nested", "b.h", ")"]),
+            ("add_subdirectory", ["lib"]),
+        ])
+
+    def test_bracket_argument_drops_leading_newline(self):
+        self.assertEqual(self.commands("set(X [[\nfile.cpp]])"), [("set", ["X", "file.cpp"])])
+
+    def test_unterminated_command(self):
+        self.assertEqual(self.commands('set(X "a.cpp"\n"b.cpp"'), [("set", ["X", "a.cpp", "b.cpp"])])
+
+    def test_raw_text_and_quote_inverse(self):
+        (command,) = lex('set(X a.cpp "b\\$c.cpp" [[d;e]])')
+        self.assertEqual(command.raw, ["X", "a.cpp", '"b\\$c.cpp"', "[[d;e]]"])
+        for token in ('lit${NAME}.cpp', 'x;y.cpp', 'a\\b"c@D@.cpp', "tab\tnew\nline"):
+            self.assertEqual(unescape(quote(token)), token)
+
+
+class TestLexerParsing(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_blocks_spans_and_round_trip(self):
+        content = ('project(Demo) # set(Not_Observed "x")\n'
+                   '#!CMAKE_WATCHER_OBSERVE\n'
+                   '  set(Sources "src/a.cpp" # trailing ) comment\n'
+                   '    [[src/b c.cpp]] "src/q\\"uote.cpp")\n'
+                   'add_library(demo ${Sources})\n')
+        with open(self.main_cmake, "w") as f:
+            f.write(content)
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        (block,) = watcher.results[self.main_cmake]
+        self.assertEqual((block.var_name, block.start, block.end, block.indent), ("Sources", 2, 4, "  "))
+        self.assertEqual(block.tokens, ["src/a.cpp", "src/b c.cpp", 'src/q"uote.cpp'])
+        os.makedirs(os.path.join(self.test_dir, "src"))
+        self.assertEqual(watcher.get_watch_directories(), [os.path.join(self.test_dir, "src")])
+        watcher.update_variable("Sources", "created", os.path.join(self.test_dir, "src", "d.cpp"))
+        with open(self.main_cmake) as f:
+            rewritten = f.read()
+        self.assertIn('"src/q\\"uote.cpp"\n"src/d.cpp"\n)\nadd_library(demo ${Sources})\n', rewritten)
+        # The rewritten block lexes back to the same tokens.
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        self.assertEqual(watcher.results[self.main_cmake][0].tokens,
+                         ["src/a.cpp", "src/b c.cpp", 'src/q"uote.cpp', "src/d.cpp"])
+
+    def test_rewrite_keeps_escapes_of_untouched_entries(self):
+        entries = ['"src/lit\\${NAME}.cpp"', '"src/x\\;y.cpp"', '"${GEN_DIR}/gen.cpp"', "[[src/bracket$.cpp]]",
+                   '"src/a.cpp"']
+        with open(self.main_cmake, "w") as f:
+            f.write("#!CMAKE_WATCHER_OBSERVE\nset(Sources\n" + "\n".join(entries) + "\n)\n")
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        self.assertEqual(watcher.results[self.main_cmake][0].tokens,
+                         ["src/lit${NAME}.cpp", "src/x;y.cpp", "${GEN_DIR}/gen.cpp", "src/bracket$.cpp", "src/a.cpp"])
+        os.makedirs(os.path.join(self.test_dir, "src"))
+        watcher.update_variable("Sources", "created", os.path.join(self.test_dir, "src", "new$1;@x@.cpp"))
+        with open(self.main_cmake) as f:
+            rewritten = f.read()
+        self.assertEqual(rewritten, "#!CMAKE_WATCHER_OBSERVE\nset(Sources\n" + "\n".join(entries)
+                         + '\n"src/new\\$1\\;\\@x\\@.cpp"\n)\n')
+
+if __name__ == '__main__':
+    unittest.main()
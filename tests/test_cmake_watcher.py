@@ -3,6 +3,7 @@ import tempfile
 import os
 import shutil
 from src.cmake_watcher import CMakeWatcher
+from src.watch_filter import WatchFilter
 
 class TestCMakeWatcher(unittest.TestCase):
     def setUp(self):
@@ -103,6 +104,129 @@ set(Header_Files
         self.assertIn('"path/to/a"', content)
         self.assertIn('"path/to/y"', content)
 
+    def test_index_routes_events(self):
+        # Both listed files live in <test_dir>/path/to, so that directory is indexed.
+        event_dir = os.path.join(self.test_dir, "path", "to")
+        self.assertIn(event_dir, self.watcher.dir_index)
+        self.assertIn(os.path.join(event_dir, "a"), self.watcher.path_index)
+        # An event in an unrelated directory is not routed.
+        self.assertFalse(self.watcher.update_variable_by_file_event(
+            "created", os.path.join(self.test_dir, "other", "c")))
+        # An event in an indexed directory updates the variable and the index.
+        new_file = os.path.join(event_dir, "c")
+        self.assertTrue(self.watcher.update_variable_by_file_event("created", new_file))
+        self.assertIn(new_file, self.watcher.path_index)
+        self.assertTrue(self.watcher.update_variable_by_file_event("deleted", os.path.join(event_dir, "a")))
+        self.assertNotIn(os.path.join(event_dir, "a"), self.watcher.path_index)
+        with open(self.main_cmake, "r") as f:
+            content = f.read()
+        self.assertIn('"path/to/c"', content)
+        self.assertNotIn('"path/to/a"', content)
+
+    def test_rewrite_preserves_surrounding_bytes(self):
+        # Text around the observed blocks, including CRLF endings, must survive a rewrite unchanged.
+        prefix = "project(Demo)\r\n  # keep   this\r\n"
+        middle = "\r\nadd_library(demo ${Header_Files})\r\n"
+        content = (prefix + "#!CMAKE_WATCHER_OBSERVE\r\nset(Header_Files\r\n\"path/to/a\"\r\n)\r\n"
+                   + middle + "#!CMAKE_WATCHER_OBSERVE\r\nset(Other\r\n\"lib/x\"\r\n)\r\n")
+        with open(self.main_cmake, "w", newline="") as f:
+            f.write(content)
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        blocks = watcher.results[self.main_cmake]
+        self.assertEqual([b.var_name for b in blocks], ["Header_Files", "Other"])
+        watcher.update_variable("Header_Files", "created", os.path.join(self.test_dir, "path/to/c"))
+        with open(self.main_cmake, "r", newline="") as f:
+            new_content = f.read()
+        self.assertTrue(new_content.startswith(prefix + "#!CMAKE_WATCHER_OBSERVE\r\nset(Header_Files\r\n"))
+        self.assertIn('"path/to/c"\r\n)\r\n' + middle, new_content)
+        self.assertTrue(new_content.endswith("#!CMAKE_WATCHER_OBSERVE\r\nset(Other\r\n\"lib/x\"\r\n)\r\n"))
+        # The span of the following block was shifted by the inserted line.
+        self.assertEqual("".join(watcher.file_cache[self.main_cmake][blocks[1].start:blocks[1].end]),
+                         'set(Other\r\n"lib/x"\r\n)\r\n')
+
+    def test_parse_subdirectory_tree_in_parallel(self):
+        # main -> lib, app; lib -> lib/core. Each file lists one source.
+        layout = {"": ["lib", "app"], "lib": ["core"], "app": [], os.path.join("lib", "core"): []}
+        for rel_dir, children in layout.items():
+            directory = os.path.join(self.test_dir, rel_dir)
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, "CMakeLists.txt"), "w") as f:
+                for child in children:
+                    f.write(f"add_subdirectory({child})\n")
+                f.write('#!CMAKE_WATCHER_OBSERVE\nset(Sources\n"main.cpp"\n)\n')
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse(workers=4)
+        expected = {os.path.normpath(os.path.join(self.test_dir, rel_dir, "CMakeLists.txt")) for rel_dir in layout}
+        self.assertEqual(set(watcher.results), expected)
+        self.assertEqual(set(watcher.parse_times), expected)
+        self.assertGreater(watcher.parse_total, 0)
+        for blocks in watcher.results.values():
+            self.assertEqual([(b.var_name, b.tokens) for b in blocks], [("Sources", ["main.cpp"])])
+
+    def test_reconcile_with_files_on_disk(self):
+        # On disk: a (listed) and an old README; b (listed) is gone.
+        event_dir = os.path.join(self.test_dir, "path", "to")
+        os.makedirs(event_dir)
+        for name in ("a", "README"):
+            open(os.path.join(event_dir, name), "w").close()
+        summary = self.watcher.reconcile(WatchFilter(exclude=["*.o"]))
+        # Without a stored listing, unlisted files are not taken; the listing is recorded.
+        self.assertEqual((summary["directories"], summary["added"], summary["removed"]), (1, 0, 1))
+        self.assertTrue(os.path.exists(self.watcher.listing_file))
+        self.assertTrue(self.watcher.is_excluded(self.watcher.listing_file))
+        # c and an excluded object file appear while the watcher is not running.
+        for name in ("c", "c.o"):
+            open(os.path.join(event_dir, name), "w").close()
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        summary = watcher.reconcile(WatchFilter(exclude=["*.o"]))
+        self.assertEqual((summary["added"], summary["removed"]), (1, 0))
+        self.assertEqual(summary["written"], [self.main_cmake])
+        self.assertEqual(watcher.writer.files_written, 1)
+        self.assertEqual(watcher.results[self.main_cmake][0].tokens, ["path/to/a", "path/to/c"])
+        with open(self.main_cmake, "r") as f:
+            content = f.read()
+        self.assertEqual(content, '#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"path/to/a"\n"path/to/c"\n)\n')
+        # A second scan finds nothing to correct.
+        summary = watcher.reconcile(WatchFilter(exclude=["*.o"]))
+        self.assertEqual((summary["added"], summary["removed"], summary["written"]), (0, 0, []))
+
+    def test_reconcile_variables_sharing_a_directory(self):
+        content = ('#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n)\n'
+                   '#!CMAKE_WATCHER_OBSERVE\nset(Sources\n"src/a.cpp"\n)\n')
+        with open(self.main_cmake, "w") as f:
+            f.write(content)
+        src = os.path.join(self.test_dir, "src")
+        os.makedirs(src)
+        for name in ("a.h", "a.cpp", "README.md"):
+            open(os.path.join(src, name), "w").close()
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        self.assertEqual(watcher.reconcile()["written"], [])
+        # A file created later goes to one variable only.
+        open(os.path.join(src, "b.h"), "w").close()
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        self.assertEqual(watcher.reconcile()["added"], 1)
+        tokens = sorted(token for block in watcher.results[self.main_cmake] for token in block.tokens)
+        self.assertEqual(tokens, ["src/a.cpp", "src/a.h", "src/b.h"])
+
+    def test_reconcile_keeps_expressions_and_unscanned_paths(self):
+        with open(self.main_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Sources\n"${GEN_DIR}/gen.cpp"\n"$<$<CONFIG:Debug>:path/to/dbg.cpp>"\n'
+                    '"path/to/@NAME@.cpp"\n"path/to/a"\n"path/to/b"\n"gone/x.cpp"\n)\n')
+        os.makedirs(os.path.join(self.test_dir, "path", "to"))
+        open(os.path.join(self.test_dir, "path", "to", "a"), "w").close()
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        summary = watcher.reconcile()
+        # Only the literal path in a listed directory is dropped.
+        self.assertEqual((summary["added"], summary["removed"]), (0, 1))
+        self.assertEqual(watcher.results[self.main_cmake][0].tokens,
+                         ["${GEN_DIR}/gen.cpp", "$<$<CONFIG:Debug>:path/to/dbg.cpp>", "path/to/@NAME@.cpp",
+                          "path/to/a", "gone/x.cpp"])
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+import os
+import shutil
+from watchdog.events import FileMovedEvent
+from src.cmake_watcher import CMakeWatcher
+from src.cmake_writer import CMakeWriter
+from src.file_event_handler import FileEventHandler
+
+class TestCMakeWriter(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "CMakeLists.txt")
+        with open(self.path, "wb") as f:
+            f.write(b"set(A)\n")
+        os.chmod(self.path, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_flush_writes_each_file_once_and_skips_identical_content(self):
+        for mode in CMakeWriter.FSYNC_MODES:
+            writer = CMakeWriter(fsync=mode)
+            writer.stage(self.path, b"set(B)\n")
+            writer.stage(self.path, b"set(C)\n")
+            results = writer.flush()
+            self.assertTrue(results[self.path][0])
+            with open(self.path, "rb") as f:
+                self.assertEqual(f.read(), b"set(C)\n")
+            self.assertEqual(writer.files_written, 1)
+            # Same content again: nothing is written.
+            writer.stage(self.path, b"set(C)\n")
+            self.assertFalse(writer.flush()[self.path][0])
+            self.assertEqual(writer.writes_skipped, 1)
+            with open(self.path, "wb") as f:
+                f.write(b"set(A)\n")
+        # The file keeps its permissions and no temporary file is left behind.
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.test_dir), ["CMakeLists.txt"])
+
+    def test_rename_echo_of_atomic_write_is_dropped(self):
+        with open(self.path, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n)\n')
+        watcher = CMakeWatcher(self.path, fsync="file")
+        watcher.parse()
+        handler = FileEventHandler(watcher)
+        watcher.update_variable("Header_Files", "created", os.path.join(self.test_dir, "src", "b.h"))
+        tmp_path = os.path.join(self.test_dir, ".CMakeLists.txt" + CMakeWriter.TEMP_SUFFIX)
+        self.assertTrue(watcher.is_excluded(tmp_path))
+        handler.dispatch(FileMovedEvent(tmp_path, self.path))
+        self.assertEqual(handler.stats()["echo_events"], 1)
+        self.assertEqual(handler.stats()["reloads"], 0)
+
+    def test_symlinked_file_is_written_through_the_link(self):
+        with open(self.path, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n)\n')
+        project_dir = os.path.join(self.test_dir, "project")
+        os.makedirs(project_dir)
+        link = os.path.join(project_dir, "CMakeLists.txt")
+        os.symlink(self.path, link)
+        watcher = CMakeWatcher(link)
+        watcher.parse()
+        handler = FileEventHandler(watcher)
+        watcher.update_variable("Header_Files", "created", os.path.join(project_dir, "src", "b.h"))
+        self.assertTrue(os.path.islink(link))
+        with open(self.path) as f:
+            self.assertIn('"src/b.h"', f.read())
+        # The rename echo names the target of the link.
+        tmp_path = os.path.join(self.test_dir, ".CMakeLists.txt" + CMakeWriter.TEMP_SUFFIX)
+        handler.dispatch(FileMovedEvent(tmp_path, self.path))
+        self.assertEqual(handler.stats()["echo_events"], 1)
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ["CMakeLists.txt", "project"])
+
+if __name__ == '__main__':
+    unittest.main()
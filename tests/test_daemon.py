@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+import os
+import shutil
+from watchdog.events import FileCreatedEvent
+from src.daemon import WatcherDaemon, send_command
+from tests.test_watch_schedule import FakeObserver
+
+class TestWatcherDaemon(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.shared = os.path.join(self.test_dir, "shared")
+        for rel in ("shared", "app/src", "lib"):
+            os.makedirs(os.path.join(self.test_dir, rel))
+        self.app_cmake = os.path.join(self.test_dir, "app", "CMakeLists.txt")
+        self.lib_cmake = os.path.join(self.test_dir, "lib", "CMakeLists.txt")
+        with open(self.app_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Sources\n"../shared/x.h"\n"src/main.cpp"\n)\n')
+        with open(self.lib_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Sources\n"../shared/y.h"\n)\n')
+        self.observer = FakeObserver()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def daemon(self, watch_mode):
+        daemon = WatcherDaemon(self.observer, watch_mode=watch_mode, debounce=0)
+        daemon.add_project(self.app_cmake, "app")
+        daemon.add_project(self.lib_cmake, "lib")
+        return daemon
+
+    def test_events_reach_owning_projects_only(self):
+        daemon = self.daemon("precise")
+        # The shared directory is watched once for both projects.
+        self.assertEqual(self.observer.scheduled, {
+            self.shared: False, os.path.join(self.test_dir, "app"): False,
+            os.path.join(self.test_dir, "app", "src"): False, os.path.join(self.test_dir, "lib"): False})
+        self.assertEqual(daemon.exact[self.shared], {"app", "lib"})
+        daemon.dispatch(FileCreatedEvent(os.path.join(self.shared, "z.h")))
+        daemon.dispatch(FileCreatedEvent(os.path.join(self.test_dir, "app", "src", "util.cpp")))
+        daemon.dispatch(FileCreatedEvent(os.path.join(self.test_dir, "elsewhere", "w.h")))
+        app = daemon.projects["app"].watcher.results[self.app_cmake][0].tokens
+        lib = daemon.projects["lib"].watcher.results[self.lib_cmake][0].tokens
+        self.assertEqual(app, ["../shared/x.h", "src/main.cpp", "../shared/z.h", "src/util.cpp"])
+        self.assertEqual(lib, ["../shared/y.h", "../shared/z.h"])
+        self.assertEqual(daemon.projects["lib"].handler.stats()["raw_events"], 1)
+        self.assertEqual((daemon.routed_events, daemon.unrouted_events), (2, 1))
+        daemon.remove_project("app")
+        self.assertNotIn(os.path.join(self.test_dir, "app", "src"), self.observer.scheduled)
+
+    def test_overlapping_roots_are_merged(self):
+        daemon = self.daemon("common")
+        # app's recursive root covers lib's shared directory and both CMake directories.
+        self.assertEqual(self.observer.scheduled, {self.test_dir: True})
+        self.assertEqual(daemon.owners(os.path.join(self.shared, "z.h")), {"app", "lib"})
+        self.assertEqual(daemon.owners(os.path.join(self.test_dir, "app", "src", "a.cpp")), {"app"})
+
+    def test_control_socket(self):
+        daemon = WatcherDaemon(self.observer, debounce=0)
+        socket_path = os.path.join(self.test_dir, "control.sock")
+        server = daemon.serve_control(socket_path)
+        try:
+            self.assertEqual(send_command(socket_path, {"cmd": "add", "cmake_file": self.lib_cmake, "name": "lib"}),
+                             {"ok": True, "name": "lib"})
+            self.assertTrue(daemon.projects["lib"].watcher.is_excluded(socket_path))
+            self.assertFalse(send_command(socket_path, {"cmd": "add", "cmake_file": self.lib_cmake, "name": "lib"})["ok"])
+            self.assertEqual(send_command(socket_path, {"cmd": "list"})["projects"], {"lib": self.lib_cmake})
+            self.assertIn("lib", send_command(socket_path, {"cmd": "stats"})["stats"]["projects"])
+            self.assertTrue(send_command(socket_path, {"cmd": "remove", "name": "lib"})["ok"])
+            self.assertFalse(send_command(socket_path, {"cmd": "remove", "name": "lib"})["ok"])
+            self.assertEqual(self.observer.scheduled, {})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_add_rejects_missing_projects(self):
+        daemon = WatcherDaemon(self.observer, debounce=0)
+        missing = os.path.join(self.test_dir, "nope", "CMakeLists.txt")
+        for cmake_file in (missing, self.shared):
+            response = daemon.handle_command({"cmd": "add", "cmake_file": cmake_file})
+            self.assertFalse(response["ok"])
+            self.assertIn("is not a file", response["error"])
+        self.assertEqual((daemon.projects, self.observer.scheduled), ({}, {}))
+        self.assertFalse(os.path.exists(os.path.dirname(missing)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import tempfile
+import os
+import shutil
+from watchdog.events import FileCreatedEvent, FileMovedEvent
+from src.cmake_watcher import CMakeWatcher
+from src.event_log import EventRecorder, read_events, replay, unified_diffs
+from src.file_event_handler import FileEventHandler
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        self.content = '#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n"src/b.h"\n)\n'
+        with open(self.main_cmake, "w") as f:
+            f.write(self.content)
+        self.src = os.path.join(self.test_dir, "src")
+        self.log = os.path.join(self.test_dir, "events.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def record(self):
+        # Record against a watcher that must not change the project.
+        handler = FileEventHandler(CMakeWatcher(self.main_cmake, dry_run=True), debounce=60)
+        handler.recorder = EventRecorder(self.log)
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "c.h")))
+        handler.dispatch(FileMovedEvent(os.path.join(self.src, "a.h"), os.path.join(self.src, "x.h")))
+        handler.dispatch(FileCreatedEvent(os.path.join(self.test_dir, ".cmake_observer_backup", "y.h")))
+        handler.recorder.close()
+
+    def test_log_round_trip(self):
+        self.record()
+        events = [(event_type, src, dest) for _, event_type, src, dest in read_events(self.log)]
+        self.assertEqual(events, [
+            ("created", os.path.join(self.src, "c.h"), None),
+            ("moved", os.path.join(self.src, "a.h"), os.path.join(self.src, "x.h")),
+            ("created", os.path.join(self.test_dir, ".cmake_observer_backup", "y.h"), None),
+        ])
+        # A torn last record is skipped; the records before it are kept.
+        with open(self.log, "ab") as f:
+            f.write(EventRecorder.RECORD.pack(0.0, 0, 100, 0) + b"/trunc")
+        self.assertEqual(len(list(read_events(self.log))), 3)
+
+    def test_dry_run_replay_prints_diffs(self):
+        self.record()
+        watcher = CMakeWatcher(self.main_cmake, dry_run=True)
+        watcher.parse()
+        handler = FileEventHandler(watcher, debounce=60)
+        self.assertEqual(replay(self.log, handler)[0], 3)
+        self.assertEqual(handler.stats()["ignored_events"], 1)
+        with open(self.main_cmake) as f:
+            self.assertEqual(f.read(), self.content)
+        diffs = list(unified_diffs(watcher))
+        self.assertEqual(len(diffs), 1)
+        self.assertEqual(diffs[0][0], self.main_cmake)
+        self.assertIn('-"src/a.h"\n+"src/x.h"\n "src/b.h"\n+"src/c.h"\n', diffs[0][1])
+        # Replaying for real writes exactly what the dry run showed.
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        replay(self.log, FileEventHandler(watcher))
+        self.assertEqual(list(unified_diffs(watcher)), [])
+        with open(self.main_cmake) as f:
+            self.assertEqual(f.read(), '#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/x.h"\n"src/b.h"\n"src/c.h"\n)\n')
+
+    def test_events_on_the_log_are_neither_recorded_nor_routed(self):
+        os.makedirs(self.src)
+        log = os.path.join(self.src, "trace.log")
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        watcher.exclude_path(log)
+        handler = FileEventHandler(watcher)
+        handler.recorder = EventRecorder(log)
+        handler.dispatch(FileCreatedEvent(log))
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "c.h")))
+        handler.recorder.close()
+        self.assertEqual([src for _, _, src, _ in read_events(log)], [os.path.join(self.src, "c.h")])
+        self.assertEqual(handler.stats()["ignored_events"], 1)
+        # The log is also excluded from routing, like the other files the tool writes.
+        self.assertTrue(watcher.is_excluded(log))
+        with open(self.main_cmake) as f:
+            self.assertNotIn("trace.log", f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import tempfile
+import os
+import shutil
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+from src.cmake_watcher import CMakeWatcher
+from src.event_coalescer import EventCoalescer
+from src.file_event_handler import FileEventHandler
+
+class TestEventCoalescer(unittest.TestCase):
+    def test_create_then_delete_cancels(self):
+        coalescer = EventCoalescer()
+        coalescer.add("created", "/d/a")
+        coalescer.add("modified", "/d/a")
+        coalescer.add("deleted", "/d/a")
+        self.assertEqual(coalescer.drain(), [])
+
+    def test_rename_chain_collapses(self):
+        coalescer = EventCoalescer()
+        coalescer.add("moved", "/d/a", "/d/b")
+        coalescer.add("moved", "/d/b", "/d/c")
+        self.assertEqual(coalescer.drain(), [("moved", "/d/a", "/d/c")])
+
+    def test_temp_file_swap_is_a_modification(self):
+        coalescer = EventCoalescer()
+        coalescer.add("created", "/d/a.tmp")
+        coalescer.add("modified", "/d/a.tmp")
+        coalescer.add("deleted", "/d/a")
+        coalescer.add("moved", "/d/a.tmp", "/d/a")
+        self.assertEqual(coalescer.drain(), [("modified", "/d/a", None)])
+
+class TestFileEventHandler(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        with open(self.main_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n"src/b.h"\n)\n')
+        self.watcher = CMakeWatcher(self.main_cmake)
+        self.watcher.parse()
+        self.src = os.path.join(self.test_dir, "src")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def read(self):
+        with open(self.main_cmake, "r") as f:
+            return f.read()
+
+    def test_burst_is_applied_as_one_batch(self):
+        handler = FileEventHandler(self.watcher, debounce=60)
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "c.h")))
+        handler.dispatch(FileModifiedEvent(os.path.join(self.src, "c.h")))
+        handler.dispatch(FileMovedEvent(os.path.join(self.src, "b.h"), os.path.join(self.src, "x.h")))
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "tmp.h")))
+        handler.dispatch(FileDeletedEvent(os.path.join(self.src, "tmp.h")))
+        # Nothing is applied until the quiet window ends.
+        self.assertNotIn('"src/c.h"', self.read())
+        self.assertEqual(handler.flush(), 2)
+        content = self.read()
+        self.assertIn('"src/c.h"', content)
+        self.assertIn('"src/x.h"', content)
+        self.assertNotIn('"src/b.h"', content)
+        self.assertNotIn('"src/tmp.h"', content)
+        self.assertEqual(self.watcher.writer.files_written, 1)
+        stats = handler.stats()
+        self.assertEqual((stats["raw_events"], stats["applied_events"], stats["collapsed_events"]), (5, 2, 3))
+
+    def test_no_debounce_applies_immediately(self):
+        handler = FileEventHandler(self.watcher)
+        handler.dispatch(FileDeletedEvent(os.path.join(self.src, "a.h")))
+        self.assertNotIn('"src/a.h"', self.read())
+
+    def test_own_writes_and_excluded_paths_are_dropped(self):
+        handler = FileEventHandler(self.watcher)
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "c.h")))
+        # The rewrite of CMakeLists.txt echoes back as a modification of the CMake file itself.
+        handler.dispatch(FileModifiedEvent(self.main_cmake))
+        self.assertEqual(handler.stats()["echo_events"], 1)
+        # A real external edit is no echo: the file is re-parsed, but never routed to a variable.
+        with open(self.main_cmake, "a") as f:
+            f.write("# edited\n")
+        handler.dispatch(FileModifiedEvent(self.main_cmake))
+        self.assertEqual(handler.stats()["reloads"], 1)
+        handler.dispatch(FileCreatedEvent(os.path.join(self.watcher.backup_root, "CMakeLists.txt")))
+        self.assertEqual(handler.stats()["ignored_events"], 1)
+        self.assertNotIn("CMakeLists.txt", self.read())
+        # Output files of the tool, such as a metrics dump written through a .tmp file.
+        metrics_file = os.path.join(self.src, "metrics.json")
+        self.watcher.exclude_path(metrics_file)
+        handler.dispatch(FileMovedEvent(metrics_file + ".tmp", metrics_file))
+        self.assertEqual(handler.stats()["ignored_events"], 2)
+        self.assertNotIn("metrics.json", self.read())
+
+    def test_marker_patterns_filter_events(self):
+        with open(self.main_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE *.h !*_test.h\nset(Header_Files\n"src/a.h"\n)\n'
+                    '#!CMAKE_WATCHER_OBSERVE *.cpp\nset(Sources\n"src/a.cpp"\n)\n')
+        watcher = CMakeWatcher(self.main_cmake)
+        watcher.parse()
+        self.assertEqual([b.rules.patterns for b in watcher.results[self.main_cmake]], [("*.h", "!*_test.h"), ("*.cpp",)])
+        handler = FileEventHandler(watcher)
+        # Names no variable takes are dropped by the gate; the others reach the matching variable only.
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "a.o")))
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, ".a.h.swp")))
+        self.assertEqual(handler.stats()["ignored_events"], 2)
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "b.h")))
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "b_test.h")))
+        handler.dispatch(FileCreatedEvent(os.path.join(self.src, "b.cpp")))
+        blocks = watcher.results[self.main_cmake]
+        self.assertEqual(blocks[0].tokens, ["src/a.h", "src/b.h"])
+        self.assertEqual(blocks[1].tokens, ["src/a.cpp", "src/b.cpp"])
+        # Renaming a listed file to a name its variable does not take removes it.
+        handler.dispatch(FileMovedEvent(os.path.join(self.src, "a.h"), os.path.join(self.src, "a.h.orig")))
+        self.assertEqual(blocks[0].tokens, ["src/b.h"])
+        self.assertTrue(self.read().startswith("#!CMAKE_WATCHER_OBSERVE *.h !*_test.h\nset(Header_Files\n"))
+
+    def test_external_edit_attaches_and_detaches_subtrees(self):
+        lib_cmake = os.path.join(self.test_dir, "lib", "CMakeLists.txt")
+        os.makedirs(os.path.dirname(lib_cmake))
+        with open(lib_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Lib_Sources\n"x.cpp"\n)\n')
+        reschedules = []
+        handler = FileEventHandler(self.watcher, on_schedule_change=lambda: reschedules.append(True))
+        self.watcher.schedule_dirty = False
+        with open(self.main_cmake, "w") as f:
+            f.write('add_subdirectory(lib)\n#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n)\n'
+                    '#!CMAKE_WATCHER_OBSERVE\nset(Extra\n"gen/e.h"\n)\n')
+        handler.dispatch(FileModifiedEvent(self.main_cmake))
+        self.assertEqual(set(self.watcher.results), {self.main_cmake, lib_cmake})
+        self.assertEqual([b.var_name for b in self.watcher.results[self.main_cmake]], ["Header_Files", "Extra"])
+        self.assertIn(os.path.join(self.test_dir, "lib"), self.watcher.dir_index)
+        self.assertIn(os.path.join(self.test_dir, "gen"), self.watcher.dir_index)
+        self.assertNotIn(os.path.join(self.src, "b.h"), self.watcher.path_index)
+        self.assertEqual(len(reschedules), 1)
+        # Events are routed with the new token lists right away.
+        handler.dispatch(FileCreatedEvent(os.path.join(self.test_dir, "lib", "y.cpp")))
+        with open(lib_cmake) as f:
+            self.assertIn('"y.cpp"', f.read())
+        with open(self.main_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n)\n')
+        handler.dispatch(FileModifiedEvent(self.main_cmake))
+        self.assertEqual(set(self.watcher.results), {self.main_cmake})
+        self.assertNotIn(os.path.join(self.test_dir, "lib"), self.watcher.dir_index)
+        self.assertEqual(len(reschedules), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+import json
+from src.metrics import Metrics, RateLimitFilter
+
+class TestMetrics(unittest.TestCase):
+    def test_counters_histograms_and_exports(self):
+        metrics = Metrics()
+        metrics.counter("events_received").inc(3)
+        histogram = metrics.histogram("apply_seconds")
+        for value in (0.0002, 0.0003, 0.02, 2.0):
+            histogram.observe(value)
+        metrics.gauge("queue_depth", lambda: 7)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"], {"events_received": 3})
+        self.assertEqual(snapshot["gauges"], {"queue_depth": 7})
+        self.assertEqual(snapshot["histograms"]["apply_seconds"]["count"], 4)
+        self.assertEqual(histogram.quantile(0.5), 0.0005)
+        self.assertEqual(histogram.quantile(0.99), 5.0)
+        text = metrics.to_prometheus()
+        self.assertIn("cmake_watcher_events_received 3", text)
+        self.assertIn('cmake_watcher_apply_seconds_bucket{le="0.0005"} 2', text)
+        self.assertIn('cmake_watcher_apply_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn("events_received=3", metrics.stats_line())
+        test_dir = tempfile.mkdtemp()
+        try:
+            metrics.dump(os.path.join(test_dir, "metrics.json"))
+            with open(os.path.join(test_dir, "metrics.json")) as f:
+                self.assertEqual(json.load(f)["counters"], {"events_received": 3})
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_rate_limited_logging(self):
+        rate_filter = RateLimitFilter(rate=0.001, burst=2)
+        record = lambda level: logging.LogRecord("t", level, __file__, 1, "message", (), None)
+        passed = [rate_filter.filter(record(logging.INFO)) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        self.assertEqual(rate_filter.suppressed, 3)
+        # Warnings are never suppressed.
+        self.assertTrue(rate_filter.filter(record(logging.WARNING)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import tempfile
+import os
+import shutil
+from src.cmake_watcher import CMakeWatcher
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        self.sub_cmake = os.path.join(self.test_dir, "lib", "CMakeLists.txt")
+        self.cache_file = os.path.join(self.test_dir, ".cmake_watcher_cache")
+        os.makedirs(os.path.dirname(self.sub_cmake))
+        with open(self.main_cmake, "w") as f:
+            f.write('add_subdirectory(lib)\n#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"path/to/a"\n)\n')
+        with open(self.sub_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE *.cpp\nset(Lib_Sources\n"src/x.cpp"\n)\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def parse(self):
+        watcher = CMakeWatcher(self.main_cmake, cache_file=self.cache_file)
+        watcher.parse()
+        return watcher
+
+    def test_unchanged_files_are_not_reparsed(self):
+        first = self.parse()
+        self.assertEqual((first.parse_cache.hits, first.parse_cache.misses), (0, 2))
+        self.assertTrue(os.path.exists(self.cache_file))
+        second = self.parse()
+        self.assertEqual((second.parse_cache.hits, second.parse_cache.misses), (2, 0))
+        # Cached files are not read until they are rewritten.
+        self.assertEqual(second.file_cache, {})
+        self.assertEqual([b.tokens for b in second.results[self.sub_cmake]], [["src/x.cpp"]])
+        self.assertEqual([b.rules.patterns for b in second.results[self.sub_cmake]], [("*.cpp",)])
+        second.update_variable("Lib_Sources", "created", os.path.join(self.test_dir, "lib", "src", "y.cpp"))
+        with open(self.sub_cmake) as f:
+            self.assertIn('"src/y.cpp"', f.read())
+
+    def test_changed_file_is_reparsed(self):
+        self.parse()
+        with open(self.sub_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Lib_Sources\n"src/x.cpp"\n"src/z.cpp"\n)\n')
+        os.utime(self.sub_cmake, ns=(1, 1))
+        watcher = self.parse()
+        self.assertEqual((watcher.parse_cache.hits, watcher.parse_cache.misses), (1, 1))
+        self.assertEqual([b.tokens for b in watcher.results[self.sub_cmake]], [["src/x.cpp", "src/z.cpp"]])
+
+    def test_touched_file_hits_by_hash(self):
+        self.parse()
+        os.utime(self.sub_cmake, ns=(1, 1))
+        watcher = self.parse()
+        self.assertEqual((watcher.parse_cache.hits, watcher.parse_cache.misses), (2, 0))
+
+    def test_corrupted_cache_is_ignored(self):
+        self.parse()
+        with open(self.cache_file, "rb") as f:
+            data = f.read()
+        for broken in (data[:len(data) // 2], b"garbage", b""):
+            with open(self.cache_file, "wb") as f:
+                f.write(broken)
+            watcher = self.parse()
+            self.assertEqual((watcher.parse_cache.hits, watcher.parse_cache.misses), (0, 2))
+            self.assertEqual(len(watcher.results), 2)
+
+if __name__ == '__main__':
+    unittest.main()
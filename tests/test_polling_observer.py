@@ -0,0 +1,80 @@
+import unittest
+import tempfile
+import os
+import shutil
+from src.cmake_watcher import CMakeWatcher
+from src.file_event_handler import FileEventHandler
+from src.polling_observer import PollingObserver
+from src.watch_scheduler import WatchScheduler
+
+class RecordingHandler:
+    def __init__(self):
+        self.events = []
+
+    def dispatch(self, event):
+        self.events.append((event.event_type, event.src_path, getattr(event, "dest_path", None) or None))
+
+class TestPollingObserver(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.test_dir, "src")
+        self.other = os.path.join(self.test_dir, "other")
+        os.makedirs(self.src)
+        os.makedirs(self.other)
+        for name in ("a.h", "b.h"):
+            self.touch(os.path.join(self.src, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def touch(self, path, data=""):
+        with open(path, "w") as f:
+            f.write(data)
+
+    def test_diff_reports_creates_deletes_and_renames(self):
+        observer = PollingObserver()
+        handler = RecordingHandler()
+        observer.schedule(handler, self.src)
+        observer.schedule(handler, self.other)
+        self.assertEqual(observer.poll(), 0)
+        os.rename(os.path.join(self.src, "a.h"), os.path.join(self.src, "c.h"))
+        os.rename(os.path.join(self.src, "b.h"), os.path.join(self.other, "b.h"))
+        self.touch(os.path.join(self.src, "d.h"))
+        self.assertEqual(observer.poll(), 3)
+        self.assertEqual(sorted(handler.events), [
+            ("created", os.path.join(self.src, "d.h"), None),
+            ("moved", os.path.join(self.src, "a.h"), os.path.join(self.src, "c.h")),
+            ("moved", os.path.join(self.src, "b.h"), os.path.join(self.other, "b.h")),
+        ])
+        handler.events.clear()
+        self.touch(os.path.join(self.src, "d.h"), "changed")
+        os.unlink(os.path.join(self.src, "c.h"))
+        observer.poll()
+        self.assertEqual(sorted(handler.events), [
+            ("deleted", os.path.join(self.src, "c.h"), None),
+            ("modified", os.path.join(self.src, "d.h"), None),
+        ])
+        self.assertEqual(observer.tracked_entries(), 2)
+
+    def test_events_update_variables(self):
+        main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        self.touch(main_cmake, '#!CMAKE_WATCHER_OBSERVE\nset(Header_Files\n"src/a.h"\n"src/b.h"\n)\n')
+        watcher = CMakeWatcher(main_cmake)
+        watcher.parse()
+        observer = PollingObserver()
+        scheduler = WatchScheduler(observer, FileEventHandler(watcher))
+        scheduler.sync(watcher.get_watch_schedule("precise"))
+        os.rename(os.path.join(self.src, "a.h"), os.path.join(self.src, "x.h"))
+        self.touch(os.path.join(self.src, "y.h"))
+        observer.poll()
+        self.assertEqual(watcher.results[main_cmake][0].tokens, ["src/x.h", "src/b.h", "src/y.h"])
+        written = watcher.writer.files_written
+        # The rewrite of CMakeLists.txt is seen on the next poll and recognised as our own.
+        observer.poll()
+        self.assertEqual(watcher.writer.files_written, written)
+        self.assertEqual(watcher.results[main_cmake][0].tokens, ["src/x.h", "src/b.h", "src/y.h"])
+        scheduler.sync([])
+        self.assertEqual(observer.tracked_entries(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import tempfile
+import os
+import shutil
+from src.cmake_watcher import CMakeWatcher
+from src.watch_filter import WatchFilter
+from src.watch_scheduler import WatchScheduler
+
+class FakeObserver:
+    def __init__(self):
+        self.scheduled = {}
+
+    def schedule(self, handler, path, recursive=False):
+        self.scheduled[path] = recursive
+        return path
+
+    def unschedule(self, watch):
+        del self.scheduled[watch]
+
+class TestWatchFilter(unittest.TestCase):
+    def test_patterns(self):
+        watch_filter = WatchFilter(exclude=["build/", ".git/", "*.o"])
+        self.assertTrue(watch_filter.accepts("/repo/src/a.cpp"))
+        self.assertFalse(watch_filter.accepts("/repo/src/a.o"))
+        self.assertFalse(watch_filter.accepts("/repo/build/src/a.cpp"))
+        self.assertFalse(watch_filter.accepts("/repo/.git/index"))
+        self.assertTrue(watch_filter.excludes_dir("/repo/build/gen"))
+        watch_filter = WatchFilter(include=["*.h", "*.hpp"], exclude=["*_test.h"])
+        self.assertTrue(watch_filter.accepts("/repo/a.hpp"))
+        self.assertFalse(watch_filter.accepts("/repo/a.cpp"))
+        self.assertFalse(watch_filter.accepts("/repo/a_test.h"))
+
+    def test_path_patterns_match_trailing_components(self):
+        watch_filter = WatchFilter(exclude=["third_party/*"])
+        self.assertFalse(watch_filter.accepts("/repo/third_party/zlib/zlib.h"))
+        self.assertTrue(watch_filter.accepts("/repo/my_third_party/zlib.h"))
+        watch_filter = WatchFilter(include=["src/*.h"])
+        self.assertTrue(watch_filter.accepts("/repo/src/a.h"))
+        self.assertFalse(watch_filter.accepts("/repo/src/a.cpp"))
+        self.assertFalse(watch_filter.accepts("/repo/libsrc/a.h"))
+        # Absolute patterns still have to match the whole path.
+        watch_filter = WatchFilter(include=["/repo/src/*"])
+        self.assertTrue(watch_filter.accepts("/repo/src/a.h"))
+        self.assertFalse(watch_filter.accepts("/other/repo/src/a.h"))
+
+    def test_patterns_are_matched_below_the_root(self):
+        # The project itself is checked out below a build/ directory.
+        watch_filter = WatchFilter(exclude=["build/", "src/gen/*"], root="/home/me/build/proj")
+        self.assertTrue(watch_filter.accepts("/home/me/build/proj/src/a.cpp"))
+        self.assertFalse(watch_filter.accepts("/home/me/build/proj/build/a.cpp"))
+        self.assertFalse(watch_filter.accepts("/home/me/build/proj/src/gen/a.cpp"))
+        self.assertFalse(watch_filter.excludes_dir("/home/me/build/proj"))
+        self.assertFalse(watch_filter.excludes_dir("/home/me/build/proj/src"))
+        self.assertTrue(watch_filter.excludes_dir("/home/me/build/proj/build/gen"))
+        # Paths outside the root only look at the directories below the common ancestor.
+        self.assertTrue(watch_filter.accepts("/home/me/build/shared/a.h"))
+        self.assertFalse(WatchFilter(exclude=["build/"]).accepts("/home/me/build/proj/src/a.cpp"))
+
+class TestWatchSchedule(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        for rel in ("src/core", "src/util", "build"):
+            os.makedirs(os.path.join(self.test_dir, rel))
+        self.main_cmake = os.path.join(self.test_dir, "CMakeLists.txt")
+        with open(self.main_cmake, "w") as f:
+            f.write('#!CMAKE_WATCHER_OBSERVE\nset(Sources\n"src/core/a.cpp"\n"src/util/b.cpp"\n"build/gen.cpp"\n)\n')
+        self.watcher = CMakeWatcher(self.main_cmake)
+        self.watcher.parse()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_common_and_precise_modes(self):
+        self.assertEqual(self.watcher.get_watch_schedule("common"), [(self.test_dir, True)])
+        core = os.path.join(self.test_dir, "src", "core")
+        util = os.path.join(self.test_dir, "src", "util")
+        build = os.path.join(self.test_dir, "build")
+        # The directory of CMakeLists.txt is watched too, so external edits are picked up.
+        self.assertEqual(self.watcher.get_watch_schedule("precise"),
+                         [(self.test_dir, False), (build, False), (core, False), (util, False)])
+        schedule = self.watcher.get_watch_schedule("precise", WatchFilter(exclude=["build/"]))
+        self.assertEqual(schedule, [(self.test_dir, False), (core, False), (util, False)])
+
+    def test_scheduler_syncs_differences(self):
+        observer = FakeObserver()
+        scheduler = WatchScheduler(observer, None)
+        scheduler.sync(self.watcher.get_watch_schedule("common"))
+        # A recursive root is not counted, so the tree below it is never walked.
+        self.assertIsNone(scheduler.watch_count())
+        added, removed = scheduler.sync(self.watcher.get_watch_schedule("precise"))
+        self.assertEqual(removed, [self.test_dir])
+        self.assertEqual(len(added), 4)
+        self.assertEqual(scheduler.watch_count(), 4)
+        self.assertEqual(set(observer.scheduled.values()), {False})
+
+if __name__ == '__main__':
+    unittest.main()